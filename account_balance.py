@@ -0,0 +1,132 @@
+# A BALANCE THAT WAKES UP ONLY THE WAITERS IT CAN PAY
+
+# StingySpendyConditional in synchronization_using_conditional_vars.py calls
+# cv.notify() after every single deposit, even when nobody is waiting and
+# even when the balance is still too low for the waiting spendy. The spendy
+# that is woken up has to get the lock back, check 'money < 20' again and go
+# back to sleep, which costs two context switches for nothing. With several
+# spenders waiting for different amounts it is worse: notify() may wake a
+# spender that still cannot be paid while another one that could be paid
+# keeps sleeping, so every deposit has to notify_all() and wake them all.
+
+# Here every waiter registers the amount it needs in a FIFO queue and sleeps
+# on a lock of its own. A deposit pays the waiters at the head of the queue
+# for as long as the balance covers them, takes their amount out of the
+# balance for them, and wakes up exactly those waiters. A waiter that is
+# woken up has already been paid, so it never has to check the balance again
+# and never goes back to sleep. When nobody is waiting, or when the balance
+# does not cover the first waiter, a deposit wakes up nobody at all.
+
+# Waiters are paid strictly in the order in which they arrived. A waiter
+# asking for a large amount is not overtaken by later waiters asking for
+# small ones, so it cannot be starved by them. A withdrawal that arrives
+# while others are waiting queues up behind them for the same reason.
+
+import threading
+from collections import deque
+from threading import Lock
+
+
+class _Waiter:
+    __slots__ = ('amount', 'lock')
+
+    def __init__(self, amount):
+        self.amount = amount
+        # acquired here, released by the depositor that pays this waiter
+        self.lock = Lock()
+        self.lock.acquire()
+
+
+class Balance:
+
+    def __init__(self, initial=0):
+        self._money = initial
+        self._mutex = Lock()
+        self._waiters = deque()
+        # statistics
+        self.deposits = 0
+        self.withdrawals = 0
+        self.waits = 0
+        self.wakeups = 0
+
+    @property
+    def money(self):
+        return self._money
+
+    def deposit(self, amount):
+        with self._mutex:
+            self._money += amount
+            self.deposits += 1
+            if self._waiters:
+                self._pay_waiters()
+
+    def _pay_waiters(self):
+        # called with the mutex held
+        waiters = self._waiters
+        while waiters and waiters[0].amount <= self._money:
+            waiter = waiters.popleft()
+            self._money -= waiter.amount
+            self.wakeups += 1
+            waiter.lock.release()
+
+    def withdraw(self, amount, timeout=None):
+        # Takes 'amount' out of the balance, waiting until there is enough.
+        # Returns False if 'timeout' seconds passed before that, in which case
+        # nothing was taken out.
+        with self._mutex:
+            self.withdrawals += 1
+            if not self._waiters and self._money >= amount:
+                self._money -= amount
+                return True
+            waiter = _Waiter(amount)
+            self._waiters.append(waiter)
+            self.waits += 1
+
+        if timeout is None:
+            waiter.lock.acquire()
+            return True
+        if waiter.lock.acquire(True, timeout):
+            return True
+        with self._mutex:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                # paid between the timeout and taking the mutex
+                return True
+            self.withdrawals -= 1
+            # the waiters queued behind this one may be payable now
+            self._pay_waiters()
+            return False
+
+    def waiting(self):
+        with self._mutex:
+            return len(self._waiters)
+
+    def stats(self):
+        with self._mutex:
+            operations = self.deposits + self.withdrawals
+            return {
+                'deposits': self.deposits,
+                'withdrawals': self.withdrawals,
+                'waits': self.waits,
+                'wakeups': self.wakeups,
+                'wakeups_per_operation': (self.wakeups / operations
+                                          if operations else 0.0),
+            }
+
+
+def main():
+    balance = Balance()
+    spenders = [threading.Thread(target=balance.withdraw, args=(amount,))
+                for amount in (50, 20, 30)]
+    for t in spenders:
+        t.start()
+    for _ in range(10):
+        balance.deposit(10)
+    for t in spenders:
+        t.join()
+    print('Money in the end:', balance.money, balance.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+# FETCHING DOCUMENTS WITH ASYNCIO AND KEEP-ALIVE CONNECTIONS
+
+# inter_thread_communication.main() starts one OS Thread per url and every
+# Thread opens a new TCP (and TLS) connection to the same host through
+# urllib.request.urlopen(). When thousands of documents are fetched from a
+# few hosts, most of the time goes into setting up connections, and every
+# Thread needs its own stack even though it spends its life waiting.
+
+# Here all the downloads run as asyncio tasks in a single Thread. While a
+# task waits for the network, the event loop runs the other tasks, which is
+# the same "context-switching" as with Threads but without the OS Threads.
+# The connections are kept in a pool per host: once a response has been read
+# completely, its connection is put back in the pool and the next request to
+# that host reuses it (HTTP/1.1 keep-alive) instead of connecting again.
+# A semaphore limits the number of downloads in flight, every request gets a
+# timeout, and every document is counted chunk by chunk as it arrives.
+
+import asyncio
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from letter_counting import LETTERS, count_bytes
+
+DEFAULT_CONCURRENCY = 100
+DEFAULT_CONNECTIONS_PER_HOST = 8
+DEFAULT_TIMEOUT = 30.0
+CHUNK_SIZE = 64 * 1024
+
+
+class HTTPError(Exception):
+    pass
+
+
+class ConnectionPool:
+    # Keeps at most 'connections_per_host' open connections to every host.
+    # Idle connections are reused before new ones are opened.
+
+    def __init__(self, connections_per_host=DEFAULT_CONNECTIONS_PER_HOST):
+        self.connections_per_host = connections_per_host
+        self.idle = {}
+        self.slots = {}
+        self.opened = 0
+        self.reused = 0
+
+    async def acquire(self, scheme, host, port):
+        key = (scheme, host, port)
+        slots = self.slots.get(key)
+        if slots is None:
+            slots = self.slots[key] = asyncio.Semaphore(
+                self.connections_per_host)
+        await slots.acquire()
+        idle = self.idle.setdefault(key, [])
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                self.reused += 1
+                return reader, writer, True
+            writer.close()
+        try:
+            context = ssl.create_default_context() if scheme == 'https' \
+                else None
+            reader, writer = await asyncio.open_connection(host, port,
+                                                           ssl=context)
+        except BaseException:
+            slots.release()
+            raise
+        self.opened += 1
+        return reader, writer, False
+
+    def release(self, scheme, host, port, connection, reusable):
+        key = (scheme, host, port)
+        reader, writer = connection
+        if reusable:
+            self.idle[key].append((reader, writer))
+        else:
+            writer.close()
+        self.slots[key].release()
+
+    def close(self):
+        for idle in self.idle.values():
+            for _, writer in idle:
+                writer.close()
+        self.idle.clear()
+
+
+# A malformed or truncated response is reported as an HTTPError or a
+# ConnectionResetError, like every other failed download, and never as the
+# ValueError or asyncio.IncompleteReadError raised while parsing it, so that
+# one bad response only fails its own url. The connection is then closed,
+# not put back in the pool.
+
+async def _readline(reader):
+    try:
+        return await reader.readline()
+    except ValueError:
+        # longer than the limit of the StreamReader
+        raise HTTPError('response line too long') from None
+
+
+def _parse_int(text, base, what):
+    try:
+        return int(text, base)
+    except ValueError:
+        raise HTTPError(f'malformed {what} {text!r}') from None
+
+
+async def _read_headers(reader):
+    status_line = await _readline(reader)
+    if not status_line:
+        # the server closed a kept-alive connection before we used it
+        raise ConnectionResetError('connection closed by the server')
+    parts = status_line.decode('latin-1').split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise HTTPError(f'malformed status line {status_line!r}')
+    status = _parse_int(parts[1], 10, 'status code')
+    headers = {}
+    while True:
+        line = await _readline(reader)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return parts[0], status, headers
+
+
+async def _read_body(reader, headers, on_chunk):
+    # Passes the body to on_chunk() piece by piece. Returns True when the
+    # end of the body is known from the headers, so the connection can be
+    # reused for the next request.
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            line = await _readline(reader)
+            size = _parse_int(line.split(b';')[0].strip(), 16, 'chunk size')
+            if size == 0:
+                # trailers, up to an empty line
+                while (await _readline(reader)) not in (b'\r\n', b'\n',
+                                                        b''):
+                    pass
+                return True
+            while size:
+                data = await reader.read(min(size, CHUNK_SIZE))
+                if not data:
+                    raise ConnectionResetError('truncated chunked body')
+                on_chunk(data)
+                size -= len(data)
+            try:
+                await reader.readexactly(2)
+            except asyncio.IncompleteReadError:
+                raise ConnectionResetError('truncated chunked body') \
+                    from None
+    if 'content-length' in headers:
+        remaining = _parse_int(headers['content-length'], 10,
+                               'content length')
+        while remaining:
+            data = await reader.read(min(remaining, CHUNK_SIZE))
+            if not data:
+                raise ConnectionResetError('truncated body')
+            on_chunk(data)
+            remaining -= len(data)
+        return True
+    # no length given: the body ends when the server closes the connection
+    while True:
+        data = await reader.read(CHUNK_SIZE)
+        if not data:
+            return False
+        on_chunk(data)
+
+
+class AsyncFetcher:
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY,
+                 connections_per_host=DEFAULT_CONNECTIONS_PER_HOST,
+                 timeout=DEFAULT_TIMEOUT):
+        self.pool = ConnectionPool(connections_per_host)
+        self.limit = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+
+    async def fetch(self, url, on_chunk, on_connected=None):
+        # Downloads 'url' and passes its body to on_chunk() as it arrives.
+        # Raises asyncio.TimeoutError when it takes longer than the timeout.
+        # on_connected(), if given, is called every time a connection has
+        # been acquired, that is once the download stopped waiting for the
+        # concurrency limit and for a free connection to the host.
+        async with self.limit:
+            return await asyncio.wait_for(
+                self._fetch(url, on_chunk, on_connected), self.timeout)
+
+    async def _fetch(self, url, on_chunk, on_connected=None):
+        parts = urlsplit(url)
+        scheme = parts.scheme
+        port = parts.port or (443 if scheme == 'https' else 80)
+        host = parts.hostname
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        request = (f'GET {target} HTTP/1.1\r\n'
+                   f'Host: {parts.netloc}\r\n'
+                   'User-Agent: Mozilla/5.0\r\n'
+                   'Connection: keep-alive\r\n\r\n').encode()
+
+        # A kept-alive connection may have been closed by the server while it
+        # was idle, which shows up either when the request is sent or when
+        # the status line is read. Since nothing was received yet in both
+        # cases, the request is retried once on a new connection.
+        for attempt in range(2):
+            reader, writer, reused = await self.pool.acquire(scheme, host,
+                                                             port)
+            if on_connected is not None:
+                on_connected()
+            reusable = False
+            try:
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    version, status, headers = await _read_headers(reader)
+                except (ConnectionResetError, BrokenPipeError):
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                if status != 200:
+                    raise HTTPError(f'{url}: HTTP status {status}')
+                complete = await _read_body(reader, headers, on_chunk)
+                reusable = complete and version == 'HTTP/1.1' \
+                    and headers.get('connection', '').lower() != 'close'
+                return status
+            finally:
+                # also reached when the task is cancelled by the timeout, in
+                # which case the connection is in an unknown state and closed
+                self.pool.release(scheme, host, port, (reader, writer),
+                                  reusable)
+
+    async def count_letters(self, url):
+        frequency = dict.fromkeys(LETTERS, 0)
+        await self.fetch(url, lambda data: count_bytes(data, frequency))
+        return frequency
+
+    def close(self):
+        self.pool.close()
+
+
+async def _count_letters_or_error(fetcher, url):
+    try:
+        return url, await fetcher.count_letters(url)
+    except (OSError, HTTPError, asyncio.TimeoutError) as e:
+        return url, e
+
+
+async def count_letters_as_completed(urls, **options):
+    # Async generator yielding (url, frequency) for every document, in the
+    # order in which the downloads complete. A failed download is yielded as
+    # (url, exception) instead.
+    fetcher = AsyncFetcher(**options)
+    tasks = [asyncio.ensure_future(_count_letters_or_error(fetcher, url))
+             for url in urls]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        # when the caller stops early, the remaining downloads are cancelled
+        # and awaited, so that their connections are released before the
+        # pool is closed and no task is left pending
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        fetcher.close()
+
+
+async def count_letters_async(urls, **options):
+    # Returns the letter frequencies of all the documents together, and the
+    # list of (url, error) of the downloads that failed.
+    frequency = dict.fromkeys(LETTERS, 0)
+    errors = []
+    async for url, result in count_letters_as_completed(urls, **options):
+        if isinstance(result, Exception):
+            errors.append((url, result))
+            continue
+        for letter, count in result.items():
+            frequency[letter] += count
+    return frequency, errors
+
+
+def main():
+    urls = [f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
+            for i in range(1000, 1020)]
+    start = time.time()
+    frequency, errors = asyncio.run(count_letters_async(urls))
+    end = time.time()
+    for url, error in errors:
+        print('Failed: ', url, error)
+    print(frequency)
+    print('Done, time taken: ', end - start)
+
+
+if __name__ == '__main__':
+    main()
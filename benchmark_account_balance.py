@@ -0,0 +1,119 @@
+# Benchmark of the wakeups per operation and the throughput of a balance
+# shared by depositing and withdrawing threads: a Condition that is notified
+# after every deposit, as StingySpendyConditional does in
+# synchronization_using_conditional_vars.py, against the Balance of
+# account_balance.py that wakes up only the waiters it can pay.
+
+# Spenders ask for different amounts (AMOUNTS), so a single notify() may
+# wake up a spender that still cannot be paid while one that could be paid
+# keeps sleeping, and the run may never finish. The Condition therefore has
+# to notify_all() after every deposit, which is what is measured here.
+
+# A wakeup is every time a waiting thread is woken up, whether it can then
+# withdraw or has to go back to sleep. Every spender withdraws the same total
+# and the depositors deposit exactly that much, so the balance must end at 0.
+
+# Usage: python benchmark_account_balance.py [--spenders N [N ...]]
+
+import argparse
+import sys
+import time
+from threading import Thread, Condition, Event
+
+from account_balance import Balance
+
+SPENDER_COUNTS = [1, 4, 16, 64]
+DEPOSITORS = 2
+DEPOSIT = 10
+AMOUNTS = [10, 20, 30, 40, 50, 60]
+# every spender withdraws this much in total, a multiple of every amount
+SPENDER_TOTAL = 600 * 50
+
+
+class ConditionBalance:
+    # StingySpendyConditional with the amount as a parameter
+
+    def __init__(self, initial=0):
+        self.money = initial
+        self.cv = Condition()
+        self.deposits = 0
+        self.withdrawals = 0
+        self.wakeups = 0
+
+    def deposit(self, amount):
+        with self.cv:
+            self.money += amount
+            self.deposits += 1
+            self.cv.notify_all()
+
+    def withdraw(self, amount):
+        with self.cv:
+            self.withdrawals += 1
+            while self.money < amount:
+                self.cv.wait()
+                self.wakeups += 1
+            self.money -= amount
+
+    def stats(self):
+        return {'deposits': self.deposits, 'withdrawals': self.withdrawals,
+                'wakeups': self.wakeups}
+
+
+def run(balance, spenders):
+    gate = Event()
+
+    def depositor(count):
+        gate.wait()
+        for i in range(count):
+            balance.deposit(DEPOSIT)
+
+    def spender(amount):
+        gate.wait()
+        for i in range(SPENDER_TOTAL // amount):
+            balance.withdraw(amount)
+
+    deposits = spenders * SPENDER_TOTAL // DEPOSIT
+    counts = [deposits // DEPOSITORS] * DEPOSITORS
+    counts[0] += deposits % DEPOSITORS
+    threads = [Thread(target=depositor, args=(count,)) for count in counts]
+    threads += [Thread(target=spender, args=(AMOUNTS[i % len(AMOUNTS)],))
+                for i in range(spenders)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    gate.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stats = balance.stats()
+    operations = stats['deposits'] + stats['withdrawals']
+    return operations / elapsed, stats['wakeups'] / operations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spenders', type=int, nargs='+',
+                        default=SPENDER_COUNTS)
+    args = parser.parse_args()
+
+    strategies = [
+        ('notify_all', ConditionBalance),
+        ('targeted', Balance),
+    ]
+    print(f'{"spenders":>9} {"strategy":>11} {"ops/s":>12} '
+          f'{"wakeups/op":>11} {"final":>6}')
+    failed = False
+    for spenders in args.spenders:
+        for name, strategy in strategies:
+            balance = strategy(0)
+            rate, wakeups = run(balance, spenders)
+            print(f'{spenders:>9} {name:>11} {rate:>12,.0f} {wakeups:>11.4f} '
+                  f'{balance.money:>6}')
+            failed = failed or balance.money != 0
+    if failed:
+        print('ERROR: the balance did not end at 0')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Benchmark of fetching and counting many documents from one host with one
+# Thread per url and a new connection per request (the way
+# inter_thread_communication.main() does it) against the asyncio fetcher from
+# async_fetching.py, which reuses keep-alive connections from a pool. The
+# documents are served by the local stand-in server from local_http_server.py
+# and the counts are checked against the expected ones.
+
+# Usage: python benchmark_async_fetching.py [--documents N] [--size BYTES]
+
+import argparse
+import asyncio
+import time
+from threading import Lock
+
+from async_fetching import AsyncFetcher, count_letters_as_completed
+from implementing_wait_groups import WaitGroup
+from inter_thread_communication import LETTERS, count_letters_synchronized
+from local_http_server import LocalDocumentServer, expected_frequency
+
+
+def expected_total(names, size):
+    total = dict.fromkeys(LETTERS, 0)
+    for name in names:
+        for letter, count in expected_frequency(name, size).items():
+            total[letter] += count
+    return total
+
+
+def run_threads(urls):
+    frequency = dict.fromkeys(LETTERS, 0)
+    mutex = Lock()
+    wait_group = WaitGroup()
+    for url in urls:
+        wait_group.go(count_letters_synchronized, url, frequency, mutex)
+    wait_group.wait()
+    return frequency
+
+
+async def run_async(urls, concurrency, connections_per_host):
+    # count_letters_as_completed() creates its own fetcher, so to report the
+    # pool statistics we drive an AsyncFetcher directly here
+    frequency = dict.fromkeys(LETTERS, 0)
+    fetcher = AsyncFetcher(concurrency, connections_per_host)
+    results = await asyncio.gather(*(fetcher.count_letters(url)
+                                     for url in urls))
+    fetcher.close()
+    for result in results:
+        for letter, count in result.items():
+            frequency[letter] += count
+    return frequency, {'opened': fetcher.pool.opened,
+                       'reused': fetcher.pool.reused}
+
+
+async def first_document_latency(urls):
+    start = time.perf_counter()
+    async for _ in count_letters_as_completed(urls):
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=1000)
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--connections-per-host', type=int, default=8)
+    args = parser.parse_args()
+
+    names = [f'rfc{1000 + i}.txt' for i in range(args.documents)]
+    expected = expected_total(names, args.size)
+    with LocalDocumentServer(args.size) as server:
+        urls = [server.url(name) for name in names]
+
+        start = time.perf_counter()
+        frequency = run_threads(urls)
+        elapsed = time.perf_counter() - start
+        print(f'thread per url: {elapsed:.2f} s, '
+              f'{len(urls)} connections opened, '
+              f'correct: {frequency == expected}')
+
+        start = time.perf_counter()
+        frequency, stats = asyncio.run(run_async(
+            urls, args.concurrency, args.connections_per_host))
+        elapsed = time.perf_counter() - start
+        print(f'asyncio pool:   {elapsed:.2f} s, '
+              f'{stats["opened"]} connections opened, '
+              f'{stats["reused"]} reused, correct: {frequency == expected}')
+
+        latency = asyncio.run(first_document_latency(urls))
+        print(f'asyncio first document counted after {latency * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
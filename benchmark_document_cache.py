@@ -0,0 +1,91 @@
+# Benchmark of the document and frequency caches from document_cache.py
+# against the local stand-in server from local_http_server.py: a cold run,
+# a warm run that needs no network I/O and no counting, a run that has to
+# revalidate every document, the same warm run from several Processes at
+# once, and a run with a cache too small for all the documents.
+
+# Usage: python benchmark_document_cache.py [--documents N] [--size BYTES]
+
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from document_cache import DocumentCache
+from inter_thread_communication import LETTERS, count_letters_map_reduce
+from local_http_server import LocalDocumentServer, expected_frequency
+
+
+def expected_total(names, size):
+    total = dict.fromkeys(LETTERS, 0)
+    for name in names:
+        for letter, count in expected_frequency(name, size).items():
+            total[letter] += count
+    return total
+
+
+def run(label, server, cache, urls, expected):
+    requests = server.requests
+    start = time.perf_counter()
+    frequency = count_letters_map_reduce(urls, mapper=cache.count_letters)
+    elapsed = time.perf_counter() - start
+    stats = cache.report()
+    print(f'{label:>24} {elapsed:>8.3f} s {server.requests - requests:>8} '
+          f'{stats["document_hit_rate"]:>9.0%} '
+          f'{stats["frequency_hit_rate"]:>9.0%} '
+          f'{str(frequency == expected):>8}')
+
+
+def count_in_process(args):
+    directory, urls = args
+    cache = DocumentCache(directory)
+    return count_letters_map_reduce(urls, mapper=cache.count_letters)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    names = [f'rfc{1000 + i}.txt' for i in range(args.documents)]
+    expected = expected_total(names, args.size)
+    directory = tempfile.mkdtemp(prefix='letter-count-cache-')
+    print(f'{"run":>24} {"time":>10} {"requests":>8} {"doc hits":>9} '
+          f'{"freq hits":>9} {"correct":>8}')
+    try:
+        with LocalDocumentServer(args.size) as server:
+            urls = [server.url(name) for name in names]
+            run('cold', server, DocumentCache(directory), urls, expected)
+            run('warm', server, DocumentCache(directory), urls, expected)
+            run('revalidate (max_age=0)', server,
+                DocumentCache(directory, max_age=0), urls, expected)
+
+            requests = server.requests
+            start = time.perf_counter()
+            with multiprocessing.Pool(args.processes) as pool:
+                results = pool.map(count_in_process,
+                                   [(directory, urls)] * args.processes)
+            elapsed = time.perf_counter() - start
+            correct = all(r == expected for r in results)
+            label = f'warm, {args.processes} processes'
+            print(f'{label:>24} {elapsed:>8.3f} s '
+                  f'{server.requests - requests:>8} {"":>9} {"":>9} '
+                  f'{str(correct):>8}')
+
+            # every run uses a new DocumentCache, so that the hit rates are
+            # those of that run only
+            small = tempfile.mkdtemp(dir=directory)
+            max_bytes = args.size * args.documents // 4
+            run('cold, 1/4 size cache', server,
+                DocumentCache(small, max_bytes), urls, expected)
+            run('again, 1/4 size cache', server,
+                DocumentCache(small, max_bytes), urls, expected)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
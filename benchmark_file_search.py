@@ -0,0 +1,149 @@
+# Benchmark of the bounded work-queue file_search() against the thread per
+# directory file_search_thread_per_directory() from using_joins.py and the
+# multi-process parallel_file_search() on a synthetic directory tree.
+
+# The tree is generated once, in a directory of its own under the given
+# directory named after the number of entries, and reused by later runs with
+# the same number of entries. Every directory holds FILES_PER_DIRECTORY
+# empty files and DIRECTORIES_PER_DIRECTORY subdirectories, breadth first,
+# until the requested number of entries exists.
+
+# Usage: python benchmark_file_search.py [--entries N] [--root PATH]
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+
+import using_joins
+from parallel_file_search import parallel_file_search
+
+FILES_PER_DIRECTORY = 20
+DIRECTORIES_PER_DIRECTORY = 4
+NEEDLE = 'needle'
+
+
+def build_tree(root, entries):
+    # Returns the directory of the tree of 'entries' entries under 'root'
+    tree = os.path.join(root, f'tree-{entries}')
+    marker = os.path.join(tree, '.complete')
+    if os.path.exists(marker):
+        return tree
+    # left over from an interrupted build
+    shutil.rmtree(tree, ignore_errors=True)
+    os.makedirs(tree)
+    root = tree
+    created = 0
+    pending = deque([root])
+    while created < entries:
+        directory = pending.popleft()
+        for _ in range(FILES_PER_DIRECTORY):
+            # one file in every 1000 matches the searched name
+            name = f'{NEEDLE}{created}.txt' if created % 1000 == 0 \
+                else f'file{created}.txt'
+            open(os.path.join(directory, name), 'w').close()
+            created += 1
+        for i in range(DIRECTORIES_PER_DIRECTORY):
+            sub = os.path.join(directory, f'dir{i}')
+            os.mkdir(sub)
+            pending.append(sub)
+            created += 1
+    open(marker, 'w').close()
+    return tree
+
+
+class ThreadSampler:
+    # samples threading.active_count() in the background to find the peak
+    # number of threads used by a search
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=())
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+
+def count_directories(root):
+    return sum(1 for _ in os.walk(root))
+
+
+def run(name, search, root, directories):
+    using_joins.matches.clear()
+    error = None
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        try:
+            # the thread per directory version prints every directory
+            with contextlib.redirect_stdout(io.StringIO()):
+                search(root, NEEDLE)
+        except RuntimeError as e:
+            # "can't start new thread"
+            error = e
+        elapsed = time.perf_counter() - start
+    result = f'{directories / elapsed:>12.0f} {sampler.peak:>12} ' \
+        f'{len(using_joins.matches):>10}'
+    if error is not None:
+        result += f'  failed: {error}'
+    print(f'{name:>28} {elapsed:>10.2f} ' + result)
+
+
+def run_streaming(processes, root):
+    # the list based versions only hand over their matches once the whole
+    # walk is done, the generator yields them as soon as they are found
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in parallel_file_search(root, NEEDLE, processes):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    elapsed = time.perf_counter() - start
+    first = elapsed if first is None else first
+    print(f'{processes:>28} {first:>16.3f} {elapsed:>10.2f} {count:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--root', default=os.path.join(
+        tempfile.gettempdir(), 'file-search-benchmark'))
+    args = parser.parse_args()
+
+    print(f'Building a tree of {args.entries} entries in {args.root}')
+    root = build_tree(args.root, args.entries)
+    directories = count_directories(root)
+    print(f'{"version":>28} {"seconds":>10} {"dirs/sec":>12} '
+          f'{"peak threads":>12} {"matches":>10}')
+    run('thread per directory', using_joins.file_search_thread_per_directory,
+        root, directories)
+    for workers in (1, 4, using_joins.DEFAULT_WORKERS, 32):
+        run(f'work queue, {workers} workers',
+            lambda root, name: using_joins.file_search(root, name, workers),
+            root, directories)
+
+    print()
+    print(f'{"parallel_file_search procs":>28} {"first match (s)":>16} '
+          f'{"seconds":>10} {"matches":>10}')
+    for processes in sorted({1, 2, os.cpu_count() or 1}):
+        run_streaming(processes, root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Benchmark of the persistent file search index from file_search_index.py:
+# a cold run that builds the index, warm runs that reuse it, and incremental
+# refreshes after N files were added to the tree, compared with a full walk
+# by file_search() from using_joins.py.
+
+# The tree is cached by build_tree() and shared with the other benchmarks, so
+# the added files get names unique to this run, which also makes sure that
+# every run really changes the directories, and they are removed again at
+# the end, even when the benchmark fails.
+
+# Usage: python benchmark_file_search_index.py [--entries N] [--root PATH]
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import using_joins
+from benchmark_file_search import build_tree, NEEDLE
+from file_search_index import FileSearchIndex, indexed_file_search
+
+CHANGE_COUNTS = [1, 10, 100, 1000]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--root', default=os.path.join(
+        tempfile.gettempdir(), 'file-search-benchmark'))
+    args = parser.parse_args()
+
+    print(f'Building a tree of {args.entries} entries in {args.root}')
+    root = build_tree(args.root, args.entries)
+    index_path = os.path.join(tempfile.gettempdir(),
+                              f'file-search-benchmark-{args.entries}.index')
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    using_joins.matches.clear()
+    elapsed, _ = timed(using_joins.file_search, root, NEEDLE)
+    print(f'{"full walk (file_search)":>36} {elapsed * 1000:>10.1f} ms')
+    expected = sorted(using_joins.matches)
+
+    elapsed, found = timed(indexed_file_search, root, NEEDLE, index_path)
+    print(f'{"cold (build + save + search)":>36} {elapsed * 1000:>10.1f} ms')
+    assert sorted(found) == expected
+    elapsed, found = timed(indexed_file_search, root, NEEDLE, index_path)
+    label = 'warm (load + refresh + search)'
+    print(f'{label:>36} {elapsed * 1000:>10.1f} ms')
+    elapsed, found = timed(indexed_file_search, root, NEEDLE, index_path,
+                           False)
+    print(f'{"warm (load + search)":>36} {elapsed * 1000:>10.1f} ms')
+
+    index = FileSearchIndex.load(root, index_path)
+    index.search(NEEDLE)
+    elapsed, found = timed(index.search, NEEDLE)
+    print(f'{"warm (in memory search)":>36} {elapsed * 1000:>10.1f} ms')
+
+    directories = sorted(index.directories)
+    random.seed(0)
+    run = uuid.uuid4().hex[:8]
+    added = []
+    try:
+        for n in CHANGE_COUNTS:
+            for i in range(n):
+                directory = random.choice(directories)
+                path = os.path.join(directory,
+                                    f'{NEEDLE}-added-{run}-{n}-{i}.txt')
+                open(path, 'w').close()
+                added.append(path)
+            elapsed, stats = timed(index.refresh)
+            label = f'refresh after {n} changes'
+            print(f'{label:>36} {elapsed * 1000:>10.1f} ms '
+                  f'({stats["rescanned"]} directories rescanned)')
+            elapsed, found = timed(index.search, NEEDLE)
+            print(f'{"search after refresh":>36} '
+                  f'{elapsed * 1000:>10.1f} ms ({len(found)} matches)')
+    finally:
+        for path in added:
+            os.remove(path)
+    # the saved index matches the tree as build_tree() left it
+    index.refresh()
+    index.save()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Benchmark of the tail latency of batches of downloads with and without
+# hedged requests from hedged_fetching.py, against the local stand-in server
+# from local_http_server.py set up to delay a random fraction of its answers.
+# A last run shows a batch deadline shorter than the injected delay.
+
+# Usage: python benchmark_hedged_fetching.py [--batches N] [--batch-size N]
+#                                            [--slow-fraction F] [--delay S]
+
+import argparse
+import asyncio
+
+from hedged_fetching import HedgedFetcher
+from local_http_server import LocalDocumentServer
+
+
+async def run_batches(server, batches, batch_size, hedge_percentile,
+                      deadline=None):
+    # enough connections for every download of a batch and its hedge
+    fetcher = HedgedFetcher(hedge_percentile,
+                            connections_per_host=2 * batch_size)
+    try:
+        for b in range(batches):
+            urls = [server.url(f'rfc{1000 + b * batch_size + i}.txt')
+                    for i in range(batch_size)]
+            await fetcher.count_batch(urls, deadline)
+    finally:
+        fetcher.close()
+    return fetcher.report()
+
+
+def print_report(label, stats):
+    print(f'{label:>28} {stats["p50"] * 1000:>9.1f} '
+          f'{stats["p99"] * 1000:>9.1f} {stats["max"] * 1000:>9.1f} '
+          f'{stats["hedges"]:>7} '
+          f'{stats["hedge_wins"]:>5} {stats["missed"]:>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--slow-fraction', type=float, default=0.02)
+    parser.add_argument('--delay', type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f'{args.slow_fraction:.0%} of the requests delayed by '
+          f'{args.delay} s, batch latencies in ms')
+    print(f'{"":>28} {"p50":>9} {"p99":>9} {"max":>9} {"hedges":>7} '
+          f'{"wins":>5} {"missed":>7}')
+    with LocalDocumentServer(20000, args.slow_fraction, args.delay) as server:
+        for label, hedge_percentile in [('no hedging', None),
+                                        ('hedge at p95', 95),
+                                        ('hedge at p90', 90)]:
+            stats = asyncio.run(run_batches(server, args.batches,
+                                            args.batch_size,
+                                            hedge_percentile))
+            print_report(label, stats)
+        deadline = args.delay / 2
+        stats = asyncio.run(run_batches(server, args.batches, args.batch_size,
+                                        None, deadline))
+        print_report(f'no hedging, {deadline} s deadline', stats)
+
+
+if __name__ == '__main__':
+    main()
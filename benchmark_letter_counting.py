@@ -0,0 +1,138 @@
+# Benchmark of the different ways of counting letters over several documents
+# in parallel from inter_thread_communication.py: threads sharing one
+# frequency table without a lock, with a lock taken for every letter, with a
+# lock taken once per document, and the map-reduce version where every
+# worker counts into its own table, with Threads and with Processes.
+
+# The documents are generated in memory so that the benchmark measures the
+# counting and the synchronization only, not the network. For every variant
+# we report the throughput and whether the counts match a serial count.
+
+# It also compares the original per-character loop over str(bytes) with the
+# byte-level count_bytes() engine from letter_counting.py on a single large
+# document held in bytes, in a memoryview and in an mmap of a file.
+
+# Usage: python benchmark_letter_counting.py [--documents N] [--size BYTES]
+#                                            [--engine-size BYTES]
+
+import argparse
+import mmap
+import random
+import string
+import tempfile
+import time
+from threading import Lock
+
+from implementing_wait_groups import WaitGroup
+from inter_thread_communication import (LETTERS, count_text,
+                                        count_letters_map_reduce)
+from letter_counting import count_bytes, numpy
+
+
+def make_documents(count, size):
+    random.seed(0)
+    alphabet = string.ascii_letters + string.digits + ' \n.,;-'
+    return [''.join(random.choices(alphabet, k=size)) for _ in range(count)]
+
+
+def count_document(txt):
+    frequency = dict.fromkeys(LETTERS, 0)
+    count_text(txt, frequency)
+    return frequency
+
+
+def count_text_locked_per_letter(txt, frequency, mutex):
+    for char in txt:
+        letter = char.lower()
+        if letter in frequency:
+            mutex.acquire()
+            frequency[letter] += 1
+            mutex.release()
+
+
+def count_text_locked_once(txt, frequency, mutex):
+    mutex.acquire()
+    count_text(txt, frequency)
+    mutex.release()
+
+
+def run_shared(documents, func, *args):
+    frequency = dict.fromkeys(LETTERS, 0)
+    wait_group = WaitGroup()
+    for txt in documents:
+        wait_group.go(func, txt, frequency, *args)
+    wait_group.wait()
+    return frequency
+
+
+def compare_engines(size):
+    random.seed(0)
+    alphabet = (string.ascii_letters + string.digits + ' \n.,;-').encode()
+    data = bytes(random.choices(alphabet, k=size))
+    megabytes = size / 1e6
+
+    def per_char_loop():
+        frequency = dict.fromkeys(LETTERS, 0)
+        count_text(str(data), frequency)
+        return frequency
+
+    engine = 'numpy' if numpy is not None else 'translate/count'
+    print(f'Counting engines on {megabytes:.1f} MB ({engine} engine)')
+    print(f'{"input":>24} {"seconds":>10} {"MB/s":>10} {"speedup":>8}')
+    with tempfile.TemporaryFile() as f:
+        f.write(data)
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            baseline = None
+            for name, run in [('str() per-char loop', per_char_loop),
+                              ('count_bytes(bytes)',
+                               lambda: count_bytes(data)),
+                              ('count_bytes(memoryview)',
+                               lambda: count_bytes(memoryview(data))),
+                              ('count_bytes(mmap)', lambda: count_bytes(mm))]:
+                start = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                print(f'{name:>24} {elapsed:>10.3f} '
+                      f'{megabytes / elapsed:>10.1f} '
+                      f'{baseline / elapsed:>7.1f}x')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--engine-size', type=int, default=8000000)
+    args = parser.parse_args()
+
+    compare_engines(args.engine_size)
+
+    documents = make_documents(args.documents, args.size)
+    megabytes = args.documents * args.size / 1e6
+    expected = count_document(''.join(documents))
+
+    variants = [
+        ('unsynchronized', lambda: run_shared(documents, count_text)),
+        ('lock per letter', lambda: run_shared(
+            documents, count_text_locked_per_letter, Lock())),
+        ('lock per document', lambda: run_shared(
+            documents, count_text_locked_once, Lock())),
+        ('map-reduce threads', lambda: count_letters_map_reduce(
+            documents, args.documents, mapper=count_document)),
+        ('map-reduce processes', lambda: count_letters_map_reduce(
+            documents, args.documents, use_processes=True,
+            mapper=count_document)),
+    ]
+    print(f'{"variant":>22} {"seconds":>10} {"MB/s":>10} {"correct":>8}')
+    for name, run in variants:
+        start = time.perf_counter()
+        frequency = run()
+        elapsed = time.perf_counter() - start
+        print(f'{name:>22} {elapsed:>10.2f} {megabytes / elapsed:>10.2f} '
+              f'{str(frequency == expected):>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Benchmark of count_letters_pipeline() from inter_thread_communication.py
+# on many URLs served by the local stand-in server from local_http_server.py.
+
+# The URLs come from a generator, so they are only created as the pipeline
+# takes them. The peak memory of the process is sampled while the pipeline
+# runs and printed every --report-every URLs: with bounded queues it levels
+# off after the first few hundred URLs instead of growing with the number of
+# URLs. The report shows, for every stage, its throughput, the depth of its
+# input queue (mean/max/capacity), and the seconds its workers spent
+# working, starved of input and blocked by the stage after them.
+
+# Usage: python benchmark_pipeline.py [--urls N] [--size BYTES]
+#            [--fetch-workers N] [--count-workers N] [--capacity N]
+
+import argparse
+import resource
+import sys
+import time
+
+from inter_thread_communication import LETTERS, count_letters_pipeline
+from local_http_server import LocalDocumentServer, expected_frequency
+from pipeline import format_report
+
+URLS = 10000
+DOCUMENT_SIZE = 20000
+REPORT_EVERY = 1000
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--urls', type=int, default=URLS)
+    parser.add_argument('--size', type=int, default=DOCUMENT_SIZE)
+    parser.add_argument('--fetch-workers', type=int, default=20)
+    parser.add_argument('--count-workers', type=int, default=2)
+    parser.add_argument('--capacity', type=int, default=8)
+    parser.add_argument('--report-every', type=int, default=REPORT_EVERY)
+    args = parser.parse_args()
+
+    # all documents share one name, so the expected counts are simply
+    # those of one document times the number of URLs
+    name = 'rfc1000.txt'
+    expected = {letter: count * args.urls for letter, count
+                in expected_frequency(name, args.size).items()}
+    frequency = dict.fromkeys(LETTERS, 0)
+
+    with LocalDocumentServer(document_size=args.size) as server:
+        url = server.url(name)
+        start = time.perf_counter()
+
+        def urls():
+            for i in range(args.urls):
+                if i and i % args.report_every == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f'{i:>8} urls taken {elapsed:>8.1f} s'
+                          f' peak memory {peak_rss_mb():>8.1f} MB')
+                yield url
+
+        pipeline = count_letters_pipeline(
+            urls(), frequency, fetch_workers=args.fetch_workers,
+            count_workers=args.count_workers, capacity=args.capacity)
+
+    print(f'{args.urls} urls in {pipeline.seconds:.1f} s, '
+          f'{args.urls / pipeline.seconds:.1f} urls/s, '
+          f'peak memory {peak_rss_mb():.1f} MB, '
+          f'source blocked {pipeline.source_blocked:.1f} s')
+    print(format_report(pipeline.report()))
+    correct = frequency == expected and not pipeline.error_count
+    print('correct:', correct)
+    if not correct:
+        for stage, key, error in pipeline.errors:
+            print('Failed', stage, key, error)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+# Benchmark of the read throughput of an account as the number of reader
+# threads grows while a writer updates it at a fixed rate, with a single
+# Lock, a ReadWriteLock with reader or writer preference, and a SeqLock (see
+# read_write_locks.py).
+
+# The account has a checking and a savings balance and the writer moves
+# money between them, so every consistent read sees the same sum. A read
+# that sees a different sum has seen the account in the middle of an update
+# and is counted as torn; there must be none.
+
+# Usage: python benchmark_read_write_locks.py [--readers N [N ...]]
+#            [--write-rates N [N ...]] [--duration SECONDS]
+
+import argparse
+import sys
+import time
+from threading import Thread, Lock, Event
+
+from read_write_locks import ReadWriteLock, SeqLock
+
+READER_COUNTS = [1, 2, 4, 8, 16]
+# writes per second
+WRITE_RATES = [0, 1000, 10000]
+DURATION = 1.0
+TOTAL = 1000
+# the writer sleeps between bursts of writes, this often
+WRITE_INTERVAL = 0.001
+
+
+class Account:
+    def __init__(self):
+        self.checking = TOTAL
+        self.savings = 0
+
+
+class MutexAccount(Account):
+
+    def __init__(self):
+        super().__init__()
+        self.mutex = Lock()
+
+    def read(self):
+        with self.mutex:
+            return self.checking + self.savings
+
+    def write(self, amount):
+        with self.mutex:
+            self.checking -= amount
+            self.savings += amount
+
+
+class ReadWriteAccount(Account):
+
+    def __init__(self, prefer_writers=False):
+        super().__init__()
+        self.rw = ReadWriteLock(prefer_writers)
+
+    def read(self):
+        with self.rw.reader:
+            return self.checking + self.savings
+
+    def write(self, amount):
+        with self.rw.writer:
+            self.checking -= amount
+            self.savings += amount
+
+
+class SeqLockAccount(Account):
+
+    def __init__(self):
+        super().__init__()
+        self.seq = SeqLock()
+
+    def read(self):
+        return self.seq.read(lambda: self.checking + self.savings)
+
+    def write(self, amount):
+        with self.seq:
+            self.checking -= amount
+            self.savings += amount
+
+
+# Every thread stops by itself at the deadline. With many readers hammering
+# a lock on few cores, the main thread may not get the GIL back for a long
+# time to tell them to stop.
+
+def writer(account, rate, gate, deadline):
+    if not rate:
+        return
+    burst = max(1, round(rate * WRITE_INTERVAL))
+    amount = 10
+    gate.wait()
+    next_burst = time.perf_counter()
+    while next_burst < deadline[0]:
+        for i in range(burst):
+            account.write(amount)
+            amount = -amount
+        next_burst += burst / rate
+        delay = next_burst - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def reader(account, gate, deadline, counts, index):
+    reads = 0
+    torn = 0
+    read = account.read
+    gate.wait()
+    while time.perf_counter() < deadline[0]:
+        for i in range(100):
+            if read() != TOTAL:
+                torn += 1
+        reads += 100
+    counts[index] = (reads, torn)
+
+
+def run(account, readers, rate, duration):
+    gate = Event()
+    deadline = [0.0]
+    counts = [None] * readers
+    threads = [Thread(target=reader,
+                      args=(account, gate, deadline, counts, i))
+               for i in range(readers)]
+    threads.append(Thread(target=writer,
+                          args=(account, rate, gate, deadline)))
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    deadline[0] = start + duration
+    gate.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    reads = sum(c[0] for c in counts)
+    torn = sum(c[1] for c in counts)
+    return reads / elapsed, torn
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, nargs='+',
+                        default=READER_COUNTS)
+    parser.add_argument('--write-rates', type=int, nargs='+',
+                        default=WRITE_RATES)
+    parser.add_argument('--duration', type=float, default=DURATION)
+    args = parser.parse_args()
+
+    strategies = [
+        ('mutex', MutexAccount),
+        ('rw readers', lambda: ReadWriteAccount(prefer_writers=False)),
+        ('rw writers', lambda: ReadWriteAccount(prefer_writers=True)),
+        ('seqlock', SeqLockAccount),
+    ]
+    print(f'{"writes/s":>9} {"readers":>8} {"strategy":>11} '
+          f'{"reads/s":>13} {"torn":>5}')
+    failed = False
+    for rate in args.write_rates:
+        for readers in args.readers:
+            for name, strategy in strategies:
+                reads, torn = run(strategy(), readers, rate, args.duration)
+                print(f'{rate:>9} {readers:>8} {name:>11} {reads:>13,.0f} '
+                      f'{torn:>5}')
+                failed = failed or torn > 0
+    if failed:
+        print('ERROR: some reads saw an update in progress')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
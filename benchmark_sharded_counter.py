@@ -0,0 +1,108 @@
+# Benchmark of the StingySpendy ledger: a single mutex taken for every update
+# (StingySpendySynchronized in race_condition_example.py) against a
+# ShardedCounter, where every thread updates its own shard and only takes the
+# mutex once every 'flush_every' updates.
+
+# Half of the threads are stingy (+10) and half are spendy (-10) and every
+# thread does the same number of updates, so the money must be exactly 100 in
+# the end. The benchmark reports the updates per second of both versions and
+# fails if either of them does not end at 100.
+
+import argparse
+import sys
+import time
+from threading import Thread, Lock, Event
+
+from sharded_counter import ShardedCounter, DEFAULT_FLUSH_EVERY
+
+THREAD_COUNTS = [2, 4, 8, 16, 32]
+# Total number of updates, split evenly between all the threads
+OPERATIONS = 2000000
+INITIAL = 100
+
+
+class MutexLedger:
+    # the StingySpendySynchronized approach: one mutex for every update
+
+    def __init__(self, initial):
+        self.money = initial
+        self.mutex = Lock()
+
+    def run(self, amount, iterations):
+        for i in range(iterations):
+            self.mutex.acquire()
+            self.money += amount
+            self.mutex.release()
+
+    def value(self):
+        return self.money
+
+
+class ShardedLedger:
+
+    def __init__(self, initial, flush_every=DEFAULT_FLUSH_EVERY):
+        self.money = ShardedCounter(initial, flush_every)
+
+    def run(self, amount, iterations):
+        add = self.money.add
+        for i in range(iterations):
+            add(amount)
+        self.money.flush()
+
+    def value(self):
+        return self.money.value()
+
+
+def run_ledger(ledger, threads, operations):
+    # Returns the updates per second and the final value of the ledger
+    iterations = operations // threads
+    gate = Event()
+
+    def worker(amount):
+        gate.wait()
+        ledger.run(amount, iterations)
+
+    workers = [Thread(target=worker, args=(10 if i % 2 == 0 else -10,))
+               for i in range(threads)]
+    for t in workers:
+        t.start()
+    start = time.perf_counter()
+    gate.set()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return iterations * threads / elapsed, ledger.value()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=THREAD_COUNTS)
+    parser.add_argument('--operations', type=int, default=OPERATIONS)
+    parser.add_argument('--flush-every', type=int,
+                        default=DEFAULT_FLUSH_EVERY)
+    args = parser.parse_args()
+
+    print(f'{"threads":>8} {"mutex (ops/s)":>15} {"sharded (ops/s)":>17} '
+          f'{"speedup":>8} {"final":>12}')
+    failed = False
+    for threads in args.threads:
+        # an even number of threads keeps stingy and spendy balanced
+        threads += threads % 2
+        mutex_rate, mutex_final = run_ledger(
+            MutexLedger(INITIAL), threads, args.operations)
+        sharded_rate, sharded_final = run_ledger(
+            ShardedLedger(INITIAL, args.flush_every), threads,
+            args.operations)
+        final = f'{mutex_final}/{sharded_final}'
+        print(f'{threads:>8} {mutex_rate:>15,.0f} {sharded_rate:>17,.0f} '
+              f'{sharded_rate / mutex_rate:>7.1f}x {final:>12}')
+        if mutex_final != INITIAL or sharded_final != INITIAL:
+            failed = True
+    if failed:
+        print(f'ERROR: the money did not end at {INITIAL}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
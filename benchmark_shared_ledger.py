@@ -0,0 +1,107 @@
+# Benchmark of the throughput of SharedLedger in shared_ledger.py with more
+# and more Processes updating it at the same time.
+
+# In the 'single' mode every Process deposits into and withdraws from the same
+# account, like stingy and spendy do in race_condition_example.py, so they
+# all wait for the same lock and adding Processes does not help. In the
+# 'many' mode every Process updates random accounts out of --accounts, which
+# are spread over the --stripes locks, so the Processes rarely wait for each
+# other and the throughput grows with the number of cores.
+
+# Every Process deposits 10 and then withdraws 10 from each account it picks,
+# so every balance must be back to its initial value in the end. The
+# benchmark fails if any of them is not.
+
+# Usage: python benchmark_shared_ledger.py [--mode single many]
+#            [--processes N [N ...]] [--accounts N] [--stripes N]
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from shared_ledger import SharedLedger, DEFAULT_STRIPES
+
+OPERATIONS = 400000
+ACCOUNTS = 4096
+INITIAL = 100
+
+
+def default_process_counts():
+    counts = []
+    n = 1
+    while n < (os.cpu_count() or 1):
+        counts.append(n)
+        n *= 2
+    return counts + [os.cpu_count() or 1]
+
+
+def worker(ledger, accounts, operations, seed, gate):
+    rng = random.Random(seed)
+    picks = [rng.randrange(accounts) for _ in range(operations // 2)]
+    add = ledger.add
+    gate.wait()
+    for account in picks:
+        add(account, 10)
+        add(account, -10)
+
+
+def run(context, processes, accounts, stripes, operations):
+    # Returns the updates per second of all the Processes together and
+    # whether every balance ended at its initial value
+    with SharedLedger(accounts, INITIAL, stripes, context) as ledger:
+        gate = context.Event()
+        per_process = operations // processes
+        workers = [context.Process(target=worker,
+                                   args=(ledger, accounts, per_process, i,
+                                         gate))
+                   for i in range(processes)]
+        for p in workers:
+            p.start()
+        # give the workers time to draw their accounts before the gate opens
+        time.sleep(0.5)
+        start = time.perf_counter()
+        gate.set()
+        for p in workers:
+            p.join()
+        elapsed = time.perf_counter() - start
+        correct = all(b == INITIAL for b in ledger.balances())
+    return per_process // 2 * 2 * processes / elapsed, correct
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', nargs='+', choices=['single', 'many'],
+                        default=['single', 'many'])
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=default_process_counts())
+    parser.add_argument('--operations', type=int, default=OPERATIONS,
+                        help='updates per Process')
+    parser.add_argument('--accounts', type=int, default=ACCOUNTS)
+    parser.add_argument('--stripes', type=int, default=DEFAULT_STRIPES)
+    parser.add_argument('--start-method', default=None)
+    args = parser.parse_args()
+    context = multiprocessing.get_context(args.start_method)
+
+    print(f'{"mode":>8} {"accounts":>9} {"processes":>10} {"ops/s":>14} '
+          f'{"scaling":>8} {"correct":>8}')
+    failed = False
+    for mode in args.mode:
+        accounts = 1 if mode == 'single' else args.accounts
+        base = None
+        for processes in args.processes:
+            rate, correct = run(context, processes, accounts, args.stripes,
+                                args.operations * processes)
+            base = base or rate
+            print(f'{mode:>8} {accounts:>9} {processes:>10} {rate:>14,.0f} '
+                  f'{rate / base:>7.2f}x {str(correct):>8}')
+            failed = failed or not correct
+    if failed:
+        print(f'ERROR: some balances did not end at {INITIAL}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
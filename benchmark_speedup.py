@@ -0,0 +1,220 @@
+# SPEEDUP CURVES OF THE PROJECT'S WORKLOADS
+
+# The docstring of creating_threads.py explains Amdahl's, Gustafson's and Sun
+# and Ni's laws. This benchmark measures how the workloads of this project
+# actually behave when they are given more workers, with Threads and with
+# Processes, so that worker pools can be sized from data:
+#
+# - sleep:   creating_threads.do_work(), waiting without using the CPU
+# - cpu:     creating_threads.do_work2(), a pure Python counting loop
+# - letters: letter_counting.count_bytes() over a synthetic document
+# - search:  an os.scandir() walk of a synthetic tree, as in using_joins.py
+#
+# Strong scaling (Amdahl): the total amount of work is fixed and split over
+# 1 to N workers. The speedup is T(1) / T(N), and fitting Amdahl's law
+# S(N) = 1 / (f + (1 - f) / N) to the measured speedups gives the serial
+# fraction f of the workload as it runs on this machine, GIL included.
+#
+# Weak scaling (Gustafson): every worker gets the same amount of work, so
+# the total grows with N. The scaled speedup is N * T(1) / T(N), and fitting
+# Gustafson's law S(N) = N - f * (N - 1) gives the serial fraction again.
+# Sun and Ni's memory-bounded speedup generalises this to work that grows
+# with the memory available to each worker; for the letters workload, whose
+# memory grows linearly with its work, it is the same as Gustafson's law.
+#
+# For every run the wall time and the CPU time spent in the tasks are
+# recorded. The results are printed as a table and written as JSON, by
+# default to speedup_results.json in the temporary directory.
+
+# Usage: python benchmark_speedup.py [--max-workers N] [--scale X]
+#                                    [--workloads NAME ...] [--json PATH]
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+import creating_threads
+from benchmark_file_search import build_tree, NEEDLE
+from letter_counting import count_bytes
+from local_http_server import document_block
+
+# the search trees, one per number of entries, are built under this
+# directory and kept for the next runs
+SEARCH_ROOT = os.path.join(tempfile.gettempdir(), 'speedup-benchmark')
+DEFAULT_JSON = os.path.join(tempfile.gettempdir(), 'speedup_results.json')
+# amount of work in one task at scale 1
+TASK_SIZES = {
+    'sleep': 0.2,
+    'cpu': 2000000,
+    'letters': 8 << 20,
+    'search': 20000,
+}
+TASKS_PER_WORKER = 2
+
+_document = None
+
+
+def _letters_task(size):
+    global _document
+    if _document is None or len(_document) < size:
+        block = document_block('speedup')
+        _document = block * (size // len(block) + 1)
+    with memoryview(_document) as view:
+        count_bytes(view[:size])
+
+
+def _search_task(entries):
+    # main() builds the tree before timing, here it is only looked up
+    pending = [build_tree(SEARCH_ROOT, entries)]
+    found = 0
+    while pending:
+        with os.scandir(pending.pop()) as it:
+            for entry in it:
+                if NEEDLE in entry.name:
+                    found += 1
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+    return found
+
+
+WORKLOADS = {
+    'sleep': creating_threads.do_work,
+    'cpu': creating_threads.do_work2,
+    'letters': _letters_task,
+    'search': _search_task,
+}
+
+
+def run_task(args):
+    # Runs one task and returns the CPU time it used. In a worker Thread
+    # only the time of that Thread is counted.
+    name, size, kind = args
+    clock = time.thread_time if kind == 'threads' else time.process_time
+    start = clock()
+    WORKLOADS[name](size)
+    return clock() - start
+
+
+def _silence():
+    # do_work() and do_work2() print two lines per task
+    sys.stdout = open(os.devnull, 'w')
+
+
+def measure(kind, workers, name, size, tasks):
+    if kind == 'threads':
+        pool = ThreadPool(workers)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_silence)
+    with pool, contextlib.redirect_stdout(io.StringIO()):
+        # start every worker, and fill per-worker caches, before timing
+        pool.map(run_task, [(name, size, kind)] * workers, chunksize=1)
+        start = time.perf_counter()
+        cpu = sum(pool.map(run_task, [(name, size, kind)] * tasks,
+                           chunksize=1))
+        wall = time.perf_counter() - start
+    return wall, cpu
+
+
+def fit_amdahl(points):
+    # least squares fit of 1/S = f + (1 - f) / N, for N > 1
+    num = den = 0.0
+    for n, speedup in points:
+        if n > 1:
+            x = 1 / n
+            num += (1 / speedup - x) * (1 - x)
+            den += (1 - x) ** 2
+    return min(1.0, max(0.0, num / den)) if den else None
+
+
+def fit_gustafson(points):
+    # least squares fit of S = N - f * (N - 1), for N > 1
+    num = den = 0.0
+    for n, speedup in points:
+        if n > 1:
+            num += (n - speedup) * (n - 1)
+            den += (n - 1) ** 2
+    return min(1.0, max(0.0, num / den)) if den else None
+
+
+def worker_counts(max_workers):
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-workers', type=int,
+                        default=max(4, os.cpu_count() or 1))
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--workloads', nargs='+', default=list(WORKLOADS),
+                        choices=list(WORKLOADS))
+    parser.add_argument('--kinds', nargs='+',
+                        default=['threads', 'processes'],
+                        choices=['threads', 'processes'])
+    parser.add_argument('--json', default=DEFAULT_JSON)
+    args = parser.parse_args()
+
+    if 'search' in args.workloads:
+        build_tree(SEARCH_ROOT, int(TASK_SIZES['search'] * args.scale))
+    counts = worker_counts(args.max_workers)
+    results = {'cpu_count': os.cpu_count(), 'runs': [], 'fits': []}
+
+    print(f'{"workload":>8} {"kind":>9} {"scaling":>7} {"workers":>7} '
+          f'{"wall (s)":>9} {"cpu (s)":>9} {"speedup":>8}')
+    for name in args.workloads:
+        size = TASK_SIZES[name] * args.scale
+        if name != 'sleep':
+            size = int(size)
+        for kind in args.kinds:
+            for scaling in ('strong', 'weak'):
+                points = []
+                base = None
+                for n in counts:
+                    if scaling == 'strong':
+                        tasks = args.max_workers * TASKS_PER_WORKER
+                    else:
+                        tasks = n * TASKS_PER_WORKER
+                    wall, cpu = measure(kind, n, name, size, tasks)
+                    base = base or wall
+                    speedup = base / wall if scaling == 'strong' \
+                        else n * base / wall
+                    points.append((n, speedup))
+                    results['runs'].append({
+                        'workload': name, 'kind': kind, 'scaling': scaling,
+                        'workers': n, 'tasks': tasks, 'task_size': size,
+                        'wall_seconds': wall, 'cpu_seconds': cpu,
+                        'speedup': speedup})
+                    print(f'{name:>8} {kind:>9} {scaling:>7} {n:>7} '
+                          f'{wall:>9.3f} {cpu:>9.3f} {speedup:>8.2f}')
+                fit = fit_amdahl(points) if scaling == 'strong' \
+                    else fit_gustafson(points)
+                law = 'amdahl' if scaling == 'strong' else 'gustafson'
+                results['fits'].append({'workload': name, 'kind': kind,
+                                        'law': law, 'serial_fraction': fit})
+
+    print()
+    print(f'{"workload":>8} {"kind":>9} {"law":>9} {"serial fraction":>16}')
+    for fit in results['fits']:
+        fraction = 'n/a' if fit['serial_fraction'] is None \
+            else f'{fit["serial_fraction"]:.3f}'
+        print(f'{fit["workload"]:>8} {fit["kind"]:>9} {fit["law"]:>9} '
+              f'{fraction:>16}')
+    with open(args.json, 'w') as f:
+        json.dump(results, f, indent=4)
+    print('Results written to', args.json)
+
+
+if __name__ == '__main__':
+    main()
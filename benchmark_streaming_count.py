@@ -0,0 +1,58 @@
+# Benchmark of count_letters(), which reads the whole document before
+# counting it, against count_letters_streaming(), which counts it chunk by
+# chunk as it arrives, on synthetic documents served by the local stand-in
+# server from local_http_server.py.
+
+# For every document size we check that the counts are correct, measure the
+# throughput, and measure the peak memory allocated by Python during one
+# fetch with tracemalloc (in a separate run, since tracing slows it down).
+
+# Usage: python benchmark_streaming_count.py [--sizes BYTES [BYTES ...]]
+
+import argparse
+import time
+import tracemalloc
+
+from inter_thread_communication import (LETTERS, count_letters,
+                                        count_letters_streaming)
+from local_http_server import LocalDocumentServer, expected_frequency
+
+DOCUMENT_SIZES = [1000000, 10000000, 100000000]
+
+
+def measure(func, url):
+    frequency = dict.fromkeys(LETTERS, 0)
+    start = time.perf_counter()
+    func(url, frequency)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(url, dict.fromkeys(LETTERS, 0))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return frequency, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=DOCUMENT_SIZES)
+    args = parser.parse_args()
+
+    print(f'{"size (MB)":>10} {"version":>10} {"MB/s":>10} '
+          f'{"peak memory (MB)":>17} {"correct":>8}')
+    with LocalDocumentServer() as server:
+        for size in args.sizes:
+            name = f'rfc{size}.txt'
+            url = server.url(name, size)
+            expected = expected_frequency(name, size)
+            for version, func in [('read all', count_letters),
+                                  ('streaming', count_letters_streaming)]:
+                frequency, elapsed, peak = measure(func, url)
+                print(f'{size / 1e6:>10.1f} {version:>10} '
+                      f'{size / 1e6 / elapsed:>10.1f} {peak / 1e6:>17.2f} '
+                      f'{str(frequency == expected):>8}')
+
+
+if __name__ == '__main__':
+    main()
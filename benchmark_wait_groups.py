@@ -0,0 +1,99 @@
+# Benchmark of the wake-up latency of the different ways a parent thread can
+# wait for its child threads: joining every child in sequence, polling a
+# shared finished counter (the original approach of
+# inter_thread_communication.main) and sleeping on a WaitGroup.
+
+# The wake-up latency is the time between the moment the last task finishes
+# and the moment the waiting parent thread is running again. Every task
+# records the time at which it finished, so the latency is simply the time
+# the waiter returned minus the latest finish time. All tasks are held at a
+# start gate until every thread has been created, so that the parent thread is
+# already waiting when the tasks run.
+
+import time
+from threading import Thread, Lock, Event
+
+from implementing_wait_groups import WaitGroup
+
+TASK_COUNTS = [10, 100, 1000, 10000]
+# Interval used by the polling waiter, same as inter_thread_communication
+POLL_INTERVAL = 0.5
+# Time every task spends "working" once the start gate is opened
+TASK_DURATION = 0.01
+
+
+def task(gate, finish_times, index):
+    gate.wait()
+    time.sleep(TASK_DURATION)
+    finish_times[index] = time.perf_counter()
+
+
+def wait_with_joins(n):
+    finish_times = [0.0] * n
+    gate = Event()
+    threads = []
+    for i in range(n):
+        t = Thread(target=task, args=(gate, finish_times, i))
+        t.start()
+        threads.append(t)
+    gate.set()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - max(finish_times)
+
+
+def wait_with_polling(n):
+    finish_times = [0.0] * n
+    gate = Event()
+    mutex = Lock()
+    finished = [0]
+
+    def polled_task(index):
+        task(gate, finish_times, index)
+        mutex.acquire()
+        finished[0] += 1
+        mutex.release()
+
+    for i in range(n):
+        Thread(target=polled_task, args=(i,)).start()
+    gate.set()
+    while True:
+        mutex.acquire()
+        if finished[0] == n:
+            mutex.release()
+            break
+        mutex.release()
+        time.sleep(POLL_INTERVAL)
+    return time.perf_counter() - max(finish_times)
+
+
+def wait_with_wait_group(n):
+    finish_times = [0.0] * n
+    gate = Event()
+    wait_group = WaitGroup()
+    for i in range(n):
+        wait_group.go(task, gate, finish_times, i)
+    gate.set()
+    wait_group.wait()
+    return time.perf_counter() - max(finish_times)
+
+
+def main():
+    strategies = [
+        ('join loop', wait_with_joins),
+        ('polling', wait_with_polling),
+        ('wait group', wait_with_wait_group),
+    ]
+    print(f'{"tasks":>8} {"strategy":>12} {"wake-up latency (ms)":>22} '
+          f'{"total (ms)":>12}')
+    for n in TASK_COUNTS:
+        for name, strategy in strategies:
+            start = time.perf_counter()
+            latency = strategy(n)
+            total = time.perf_counter() - start
+            print(f'{n:>8} {name:>12} {latency * 1000:>22.3f} '
+                  f'{total * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
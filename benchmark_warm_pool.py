@@ -0,0 +1,90 @@
+# Benchmark of the per-task dispatch latency and the throughput of handing a
+# payload to another Process: starting a new Process per task with 'fork',
+# 'spawn' and 'forkserver' (as creating_processes.py does), and running the
+# task on the warm workers of warm_pool.py, with the payload pickled through
+# the pipe, passed out-of-band through shared memory, or allocated in a
+# SharedBuffer from the start.
+
+# The task only looks at the size and the first byte of its payload, so the
+# time measured is the time spent getting the payload to the worker.
+
+# Usage: python benchmark_warm_pool.py [--sizes BYTES [BYTES ...]]
+
+import argparse
+import multiprocessing
+import pickle
+import time
+
+from warm_pool import SharedBuffer, WarmPool
+
+PAYLOAD_SIZES = [1 << 10, 1 << 20, 64 << 20, 1 << 30]
+START_METHODS = ['fork', 'spawn', 'forkserver']
+
+
+def peek(payload):
+    view = memoryview(getattr(payload, 'buf', payload))
+    return len(view), view[0] if len(view) else None
+
+
+def _child(conn, payload):
+    conn.send(peek(payload))
+    conn.close()
+
+
+def new_process_per_task(context, payload):
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    p = context.Process(target=_child, args=(child_conn, payload))
+    p.start()
+    child_conn.close()
+    result = parent_conn.recv()
+    p.join()
+    return result
+
+
+def repeats_for(size):
+    return max(1, min(20, (256 << 20) // size))
+
+
+def measure(label, size, run):
+    repeats = repeats_for(size)
+    run()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = run()
+    elapsed = (time.perf_counter() - start) / repeats
+    assert result[0] == size
+    print(f'{size:>12} {label:>30} {elapsed * 1000:>12.3f} '
+          f'{size / elapsed / 1e6:>12.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=PAYLOAD_SIZES)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f'{"bytes":>12} {"method":>30} {"ms / task":>12} {"MB/s":>12}')
+    pools = {method: WarmPool(args.workers, method) for method in
+             START_METHODS}
+    try:
+        for size in args.sizes:
+            payload = bytes(size)
+            for method in START_METHODS:
+                context = multiprocessing.get_context(method)
+                measure(f'new {method} process', size,
+                        lambda: new_process_per_task(context, payload))
+            for method, pool in pools.items():
+                measure(f'warm {method}, pipe', size,
+                        lambda: pool.pool.apply(peek, (payload,)))
+                measure(f'warm {method}, out-of-band', size,
+                        lambda: pool.run(peek, pickle.PickleBuffer(payload)))
+                with SharedBuffer(size) as shared:
+                    measure(f'warm {method}, SharedBuffer', size,
+                            lambda: pool.run(peek, shared))
+    finally:
+        for pool in pools.values():
+            pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+# A MEMORY-MAPPED CONTENT SEARCH
+
+# file_search() in using_joins.py only matches file names. Here we search the
+# contents of the files, the way grep does. Reading every file into a Python
+# bytes or str object would make the memory used grow with the size of the
+# largest file, so instead every file is memory-mapped with mmap. The pages
+# of a mapped file are read by the operating system when they are touched and
+# can be dropped again by it at any time, so the memory used by the search
+# stays flat no matter how large the files are.
+
+# mmap.find() scans the mapped pages in C, but it holds the GIL while doing
+# so. The files are therefore searched in a pool of Processes, while the
+# parent Process walks the tree and hands the paths to the pool as it finds
+# them.
+
+# The matches are sent back to the parent in batches of MATCH_BATCH_SIZE
+# through a queue that holds at most QUEUE_BATCHES batches, as they are
+# found, instead of one list per file. A pattern that matches all over a
+# large file therefore does not make the memory grow with the file, and when
+# the consumer of content_search() falls behind, the workers wait for it.
+
+# Matches do not overlap, like grep -o and str.count(): after a match, the
+# search resumes at the end of the match, so 'aa' is found twice in 'aaaa',
+# not three times.
+
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+
+# files larger than this many bytes are skipped
+DEFAULT_MAX_SIZE = 1 << 30
+# a file is considered binary when its first BINARY_CHECK_SIZE bytes contain
+# a NUL byte, the same heuristic grep uses
+BINARY_CHECK_SIZE = 8192
+# newlines are counted in windows of this size so that computing a line
+# number never copies more than this many bytes at once
+LINE_COUNT_WINDOW = 1 << 20
+MATCH_BATCH_SIZE = 1000
+QUEUE_BATCHES = 64
+
+
+def _walk_files(root, max_size):
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            size = entry.stat(follow_symlinks=False).st_size
+                            if 0 < size <= max_size:
+                                yield entry.path
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+
+def _count_newlines(mm, start, end):
+    count = 0
+    for i in range(start, end, LINE_COUNT_WINDOW):
+        count += mm[i:min(end, i + LINE_COUNT_WINDOW)].count(b'\n')
+    return count
+
+
+def search_file(path, pattern, batch_size=MATCH_BATCH_SIZE):
+    # Generator yielding lists of at most 'batch_size' (offset, line number)
+    # tuples, one tuple for every occurrence of the bytes 'pattern' in the
+    # file. Line numbers start at 1. Binary files yield nothing.
+    found = []
+    try:
+        with open(path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm.find(b'\0', 0, BINARY_CHECK_SIZE) != -1:
+                return
+            if hasattr(mm, 'madvise'):
+                # we read the file once from start to end
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            line = 1
+            line_start = 0
+            position = mm.find(pattern)
+            while position != -1:
+                line += _count_newlines(mm, line_start, position)
+                line_start = position
+                found.append((position, line))
+                if len(found) >= batch_size:
+                    yield found
+                    found = []
+                position = mm.find(pattern, position + len(pattern))
+    except (OSError, ValueError):
+        # unreadable file, or a file that was emptied after the walk
+        pass
+    if found:
+        yield found
+
+
+_matches = None
+
+
+def _init_worker(matches):
+    global _matches
+    _matches = matches
+
+
+def _search_file_task(args):
+    # Puts the matches of one file on the queue, returns how many batches
+    path, pattern = args
+    batches = 0
+    for found in search_file(path, pattern):
+        _matches.put((path, found))
+        batches += 1
+    return batches
+
+
+def content_search(root, pattern, processes=None, max_size=DEFAULT_MAX_SIZE):
+    # Generator yielding (path, offset, line number) for every occurrence of
+    # 'pattern' (str or bytes) in the text files below 'root' that are not
+    # larger than 'max_size' bytes.
+    if isinstance(pattern, str):
+        pattern = pattern.encode()
+    if not pattern:
+        raise ValueError('pattern must not be empty')
+    tasks = ((path, pattern) for path in _walk_files(root, max_size))
+    matches = multiprocessing.Queue(QUEUE_BATCHES)
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(matches,))
+
+    def dispatch():
+        # imap_unordered() consumes the walk lazily, so walking the tree and
+        # searching the files overlap. A batch put by a worker may reach us
+        # after the result of its task, so instead of a sentinel, the total
+        # number of batches to expect is sent once all tasks are done.
+        total = 0
+        try:
+            for batches in pool.imap_unordered(_search_file_task, tasks,
+                                               chunksize=8):
+                total += batches
+        except Exception as e:
+            # raised again in the consumer, once the batches already put
+            # have been yielded
+            errors.append(e)
+        finally:
+            matches.put(total)
+
+    errors = []
+
+    dispatcher = threading.Thread(target=dispatch, daemon=True)
+    dispatcher.start()
+    received = 0
+    total = None
+    try:
+        while total is None or received < total:
+            item = matches.get()
+            if isinstance(item, int):
+                total = item
+                continue
+            received += 1
+            path, found = item
+            for offset, line in found:
+                yield path, offset, line
+        if errors:
+            raise errors[0]
+    finally:
+        # also when the consumer stops early, while workers may be blocked
+        # on the full queue
+        pool.terminate()
+        pool.join()
+
+
+def main():
+    start = time.perf_counter()
+    count = 0
+    for path, offset, line in content_search("C:/Program Files/", "7-Zip"):
+        count += 1
+        print(f'{path}:{line}: offset {offset}')
+    print('Matches: ', count, 'time taken: ', time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
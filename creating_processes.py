@@ -54,8 +54,23 @@ if __name__ == '__main__':
     # Initiate and start a number of processes according to
     # your CPU's capacity. you will see a peak in the cpu utilization
     # graph when this script is run.
+    processes = []
     for _ in range(12):
         # Create the Process instance
         p = Process(target=do_work, args=())
         # Start the Process
         p.start()
+        processes.append(p)
+    # Wait for every Process to finish its work before the parent exits
+    for p in processes:
+        p.join()
+
+    # Note that the 12 Processes above all run the same whole loop, so the
+    # loop itself does not finish any sooner. To split one loop across all
+    # the cores and combine the partial results, see parallel_reduce.py:
+    # parallel_reduce(count_iterations, range(20000000), operator.add)
+
+    # Every Process above also pays the full 'spawn' start-up cost for a
+    # single piece of work. To start the worker Processes once and reuse
+    # them, with large arguments passed through shared memory, see
+    # warm_pool.py.
@@ -0,0 +1,278 @@
+# AN ON-DISK CACHE FOR FETCHED DOCUMENTS AND THEIR LETTER FREQUENCIES
+
+# Every run of inter_thread_communication.main() downloads rfc1000 to rfc1019
+# again and counts them from scratch, although they never change. This cache
+# keeps two things on disk:
+
+# - The fetched documents, keyed by url. A document younger than 'max_age'
+#   seconds is used without asking the server. An older one is revalidated
+#   with a conditional request (If-None-Match / If-Modified-Since), and when
+#   the server answers '304 Not Modified' the cached copy is used again. The
+#   bodies are stored in files named after the SHA-256 of their content, so
+#   urls serving the same content share one file. When the stored bodies
+#   exceed 'max_bytes', the least recently used documents are evicted. When
+#   the content at a url changes, the body it served before is deleted as
+#   soon as no other url serves it.
+# - The letter frequencies of every document, keyed by the SHA-256 of its
+#   content. A url whose document is fresh in the cache is answered from
+#   here without reading its body or counting it at all. The frequencies of
+#   a body are deleted together with it, so this cache never outgrows the
+#   document cache.
+
+# The index of both caches is an SQLite database, which does its own locking,
+# so several Threads (each with its own connection) and several Processes
+# can use the same cache directory at the same time. Bodies are written to a
+# temporary file first and renamed into place, so no reader ever sees a half
+# written body, and a body that was evicted by another Process while we were
+# about to read it is simply fetched again.
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from letter_counting import count_bytes
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'letter-count-cache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_last_used ON documents (last_used);
+CREATE TABLE IF NOT EXISTS frequencies (
+    digest TEXT PRIMARY KEY,
+    counts TEXT NOT NULL
+);
+'''
+
+
+class DocumentCache:
+
+    def __init__(self, directory=DEFAULT_DIRECTORY,
+                 max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.stats = dict.fromkeys(
+            ['fresh', 'revalidated', 'downloaded',
+             'frequency_hits', 'frequency_misses'], 0)
+        self._db().executescript(_SCHEMA)
+
+    def _db(self):
+        # sqlite3 connections cannot be shared between Threads, so every
+        # Thread opens its own one
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.directory, 'index.db'),
+                                 timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db = db
+        return db
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', digest[:2], digest)
+
+    def _read_blob(self, digest):
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_blob(self, digest, data):
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _lookup(self, url):
+        return self._db().execute(
+            'SELECT digest, etag, last_modified, fetched_at FROM documents '
+            'WHERE url = ?', (url,)).fetchone()
+
+    def _download(self, url, cached):
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if cached is not None:
+            digest, etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        req = urllib.request.Request(url, headers=headers)
+        try:
+            response = urllib.request.urlopen(req)
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or cached is None:
+                raise
+            self._count('revalidated')
+            now = time.time()
+            self._db().execute(
+                'UPDATE documents SET fetched_at = ?, last_used = ? '
+                'WHERE url = ?', (now, now, url))
+            return cached[0], None
+        with response:
+            data = response.read()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        digest = hashlib.sha256(data).hexdigest()
+        self._write_blob(digest, data)
+        now = time.time()
+        db = self._db()
+        removed = []
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # the digest is read again inside the transaction, another
+            # Thread or Process may have replaced it since our lookup
+            previous = db.execute(
+                'SELECT digest FROM documents WHERE url = ?',
+                (url,)).fetchone()
+            db.execute(
+                'INSERT OR REPLACE INTO documents '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, digest, len(data), etag, last_modified, now, now))
+            if previous is not None and previous[0] != digest \
+                    and self._drop_if_unused(db, previous[0]):
+                removed.append(previous[0])
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._remove_blobs(removed)
+        self._evict()
+        return digest, data
+
+    def _document_digest(self, url):
+        # Returns the digest of the current document at 'url', its body when
+        # it had to be downloaded, and whether it was 'fresh', 'revalidated'
+        # or 'downloaded'. The outcome is counted by the caller, once it
+        # knows that the body did not have to be downloaded again.
+        cached = self._lookup(url)
+        if cached is not None and time.time() - cached[3] < self.max_age:
+            self._db().execute(
+                'UPDATE documents SET last_used = ? WHERE url = ?',
+                (time.time(), url))
+            return cached[0], None, 'fresh'
+        digest, data = self._download(url, cached)
+        return digest, data, 'revalidated' if data is None else 'downloaded'
+
+    def _body(self, url, digest, data, outcome):
+        # Reads the body of 'digest' from the cache unless it was just
+        # downloaded. Returns the digest, body and outcome.
+        if data is None:
+            data = self._read_blob(digest)
+            if data is None:
+                # evicted by someone else since we looked it up
+                digest, data = self._download(url, None)
+                outcome = 'downloaded'
+        return digest, data, outcome
+
+    def fetch(self, url):
+        # Returns the body of the document at 'url', from the cache when
+        # possible.
+        digest, data, outcome = self._body(url, *self._document_digest(url))
+        self._count(outcome)
+        return data
+
+    def count_letters(self, url):
+        # Returns the letter frequency table of the document at 'url'. A
+        # fresh document whose frequencies were computed before is answered
+        # without any network I/O and without counting.
+        digest, data, outcome = self._document_digest(url)
+        row = self._db().execute(
+            'SELECT counts FROM frequencies WHERE digest = ?',
+            (digest,)).fetchone()
+        if row is not None:
+            self._count(outcome)
+            self._count('frequency_hits')
+            return json.loads(row[0])
+        digest, data, outcome = self._body(url, digest, data, outcome)
+        self._count(outcome)
+        self._count('frequency_misses')
+        frequency = count_bytes(data)
+        # only stored while a document still has this body, so that the
+        # frequencies of a body evicted meanwhile are not left behind
+        self._db().execute(
+            'INSERT OR REPLACE INTO frequencies SELECT ?, ? WHERE EXISTS '
+            '(SELECT 1 FROM documents WHERE digest = ?)',
+            (digest, json.dumps(frequency), digest))
+        return frequency
+
+    def _drop_if_unused(self, db, digest):
+        # Deletes the frequencies of 'digest' when no document has this body
+        # any more, and returns True if so, in which case its blob can be
+        # removed once the transaction is committed
+        if db.execute('SELECT 1 FROM documents WHERE digest = ? LIMIT 1',
+                      (digest,)).fetchone() is not None:
+            return False
+        db.execute('DELETE FROM frequencies WHERE digest = ?', (digest,))
+        return True
+
+    def _remove_blobs(self, digests):
+        for digest in digests:
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        db = self._db()
+        # BEGIN IMMEDIATE takes the write lock of the database, so only one
+        # Thread or Process evicts at a time
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            total = db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM '
+                '(SELECT DISTINCT digest, size FROM documents)').fetchone()[0]
+            removed = []
+            rows = db.execute('SELECT url, digest, size FROM documents '
+                              'ORDER BY last_used').fetchall()
+            for url, digest, size in rows:
+                if total <= self.max_bytes:
+                    break
+                db.execute('DELETE FROM documents WHERE url = ?', (url,))
+                if self._drop_if_unused(db, digest):
+                    total -= size
+                    removed.append(digest)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._remove_blobs(removed)
+
+    def report(self):
+        # hit and miss rates of the document cache and the frequency cache
+        with self.stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['fresh'] + stats['revalidated'] + stats['downloaded']
+        counted = stats['frequency_hits'] + stats['frequency_misses']
+        stats['document_hit_rate'] = \
+            (stats['fresh'] + stats['revalidated']) / lookups if lookups \
+            else 0.0
+        stats['frequency_hit_rate'] = \
+            stats['frequency_hits'] / counted if counted else 0.0
+        return stats
@@ -0,0 +1,205 @@
+# ONE EXECUTOR FOR THREADS, PROCESSES AND SUBINTERPRETERS
+
+# creating_threads.py shows that Threads make do_work() (which sleeps, like
+# a download) five times faster, but do nothing for do_work2() (which
+# computes), because the GIL lets only one Thread run Python code at a time.
+# creating_processes.py shows that Processes do make do_work2() faster. Which
+# one to use depends on the workload, but every module chooses by
+# hard-coding Thread or Process.
+
+# An Executor runs a function on a list of items with whichever backend
+# suits the function:
+#
+#   with Executor() as executor:
+#       results = executor.map(do_work2, [20000000] * 5)
+#
+# With backend='auto' (the default), the first items are run one by one in
+# the calling thread for a short warm-up, measuring both the wall clock time
+# and the CPU time of the thread. A function that spends most of its time
+# waiting (I/O-bound) uses little CPU time and is run on IO_WORKERS Threads.
+# A function that keeps the CPU busy (CPU-bound) is run:
+#   - on Threads, one per core, when the interpreter is a free-threaded build
+#     running without the GIL, where Threads run Python code in parallel,
+#   - on subinterpreters, one per core, where the interpreter provides
+#     concurrent.futures.InterpreterPoolExecutor (Python 3.14+), since every
+#     subinterpreter has its own GIL and they start faster than Processes,
+#   - on Processes, one per core, otherwise,
+#   - in the calling thread when there is only one core, where no backend
+#     can make it faster.
+# The function, the items and the results have to be picklable to be sent
+# to Processes or subinterpreters. The function, the first item still to run
+# and the first result of the warm-up are tried; if one of them is not (a
+# lambda, a closure, an open file...), Threads are used instead. The results
+# of the warm-up are kept, they are not thrown away. Set the
+# EXECUTOR_BACKEND environment variable to 'threads', 'processes',
+# 'interpreters' or 'serial' to override the choice without editing code.
+
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+try:
+    from concurrent.futures import InterpreterPoolExecutor
+except ImportError:
+    InterpreterPoolExecutor = None
+
+from parallel_reduce import choose_chunk_size
+
+BACKENDS = ['threads', 'processes', 'interpreters', 'serial']
+DEFAULT_BACKEND = os.environ.get('EXECUTOR_BACKEND', 'auto')
+IO_WORKERS = 32
+# the warm-up runs items until this much time has passed, or WARMUP_ITEMS
+# items have been run
+WARMUP_SECONDS = 0.2
+WARMUP_ITEMS = 2
+# below this share of CPU time in the wall clock time, a function is I/O-bound
+CPU_BOUND_RATIO = 0.5
+
+
+def gil_enabled():
+    # False only on a free-threaded build running without the GIL
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled() if is_gil_enabled else True
+
+
+def cpu_count():
+    count = getattr(os, 'process_cpu_count', os.cpu_count)()
+    return count or 1
+
+
+def _picklable(obj):
+    try:
+        pickle.dumps(obj)
+    except Exception:
+        return False
+    return True
+
+
+def choose_backend(cpu_ratio, func=None, cores=None, samples=()):
+    # Returns the backend for a function that spends 'cpu_ratio' of its wall
+    # clock time on the CPU. 'samples' are an item and a result of 'func',
+    # which have to be picklable, like 'func', to use another process or
+    # interpreter.
+    cores = cores or cpu_count()
+    if cpu_ratio < CPU_BOUND_RATIO:
+        return 'threads'
+    if cores == 1:
+        return 'serial'
+    if not gil_enabled():
+        return 'threads'
+    if not _picklable((func,) + tuple(samples)):
+        return 'threads'
+    if InterpreterPoolExecutor is not None:
+        return 'interpreters'
+    return 'processes'
+
+
+class Executor:
+
+    def __init__(self, backend=DEFAULT_BACKEND, workers=None,
+                 start_method=None):
+        if backend != 'auto' and backend not in BACKENDS:
+            raise ValueError(f'unknown backend {backend!r}')
+        if backend == 'interpreters' and InterpreterPoolExecutor is None:
+            raise ValueError('subinterpreters need Python 3.14 or later')
+        self.backend = backend
+        self.workers = workers
+        self.start_method = start_method
+        # what the last map() found during its warm-up and chose
+        self.choice = None
+        self._pools = {}
+
+    def _pool(self, backend, workers):
+        key = (backend, workers)
+        if key not in self._pools:
+            if backend == 'threads':
+                self._pools[key] = ThreadPool(workers)
+            elif backend == 'processes':
+                context = multiprocessing.get_context(self.start_method)
+                self._pools[key] = context.Pool(workers)
+            else:
+                self._pools[key] = InterpreterPoolExecutor(workers)
+        return self._pools[key]
+
+    def _warm_up(self, func, items):
+        # Runs func() on the first items in this thread. Returns their
+        # results, the share of CPU time in the wall clock time, and the
+        # wall clock time per item.
+        results = []
+        wall = 0.0
+        cpu = 0.0
+        for item in items[:WARMUP_ITEMS]:
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            results.append(func(item))
+            cpu += time.thread_time() - cpu_start
+            wall += time.perf_counter() - wall_start
+            if wall >= WARMUP_SECONDS:
+                break
+        cpu_ratio = cpu / wall if wall > 0 else 1.0
+        return results, cpu_ratio, wall / max(len(results), 1)
+
+    def map(self, func, items):
+        # Returns [func(item) for item in items], in the order of the items.
+        # 'func' must be a module-level function for the 'processes' and
+        # 'interpreters' backends.
+        items = list(items)
+        results = []
+        cpu_ratio = None
+        seconds_per_item = None
+        backend = self.backend
+        if backend == 'auto':
+            results, cpu_ratio, seconds_per_item = self._warm_up(func, items)
+        rest = items[len(results):]
+        if backend == 'auto':
+            backend = choose_backend(cpu_ratio, func,
+                                     samples=rest[:1] + results[:1])
+
+        if backend == 'threads':
+            workers = self.workers or (IO_WORKERS if cpu_ratio is None
+                                       or cpu_ratio < CPU_BOUND_RATIO
+                                       else cpu_count())
+        elif backend == 'serial':
+            workers = 1
+        else:
+            workers = self.workers or cpu_count()
+        workers = max(1, min(workers, len(rest) or 1))
+        self.choice = {'backend': backend, 'workers': workers,
+                       'cpu_ratio': cpu_ratio,
+                       'seconds_per_item': seconds_per_item,
+                       'gil_enabled': gil_enabled()}
+        if not rest:
+            return results
+
+        if backend == 'serial':
+            results.extend(func(item) for item in rest)
+        elif backend == 'processes':
+            chunk_size = (choose_chunk_size(len(rest), seconds_per_item,
+                                            workers)
+                          if seconds_per_item else 1)
+            results.extend(self._pool(backend, workers).map(func, rest,
+                                                            chunk_size))
+        elif backend == 'interpreters':
+            results.extend(self._pool(backend, workers).map(func, rest))
+        else:
+            results.extend(self._pool(backend, workers).map(func, rest, 1))
+        return results
+
+    def close(self):
+        for (backend, _), pool in self._pools.items():
+            if backend == 'interpreters':
+                pool.shutdown()
+            else:
+                pool.close()
+                pool.join()
+        self._pools.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
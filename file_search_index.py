@@ -0,0 +1,168 @@
+# A PERSISTENT, INCREMENTALLY REFRESHED INDEX FOR REPEATED FILE SEARCHES
+
+# Every call of file_search() in using_joins.py walks the whole tree again,
+# even when we search the same roots many times an hour and almost nothing
+# has changed in between. Here we keep an index of the tree on disk instead.
+
+# The index remembers, for every directory, the modification time it had when
+# it was last scanned together with the names of its entries. Creating,
+# deleting or renaming an entry changes the modification time of the
+# directory holding it, so on refresh we only stat() every directory and
+# scan again the ones whose modification time changed. The names of all the
+# entries are kept in a compact sorted table: every distinct name is stored
+# once in a single string, separated by newlines, next to the directories
+# that contain an entry with that name. A substring query is then a handful
+# of str.find() calls over that string, which run in C, instead of a Python
+# loop over millions of entries.
+
+import bisect
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+
+INDEX_VERSION = 1
+
+
+def default_index_path(root):
+    digest = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f'file-search-index-{digest}')
+
+
+class FileSearchIndex:
+
+    def __init__(self, root, path=None):
+        self.root = os.path.abspath(root)
+        self.path = path if path is not None else default_index_path(root)
+        # directory -> (mtime_ns, names of its entries, names of its subdirs)
+        self.directories = {}
+        self._table = None
+
+    @classmethod
+    def load(cls, root, path=None):
+        # Returns the index saved for 'root', or an empty index when there is
+        # none yet (or it was written by an incompatible version).
+        index = cls(root, path)
+        try:
+            with open(index.path, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return index
+        if saved.get('version') == INDEX_VERSION \
+                and saved.get('root') == index.root:
+            index.directories = saved['directories']
+            index._table = saved['table']
+        return index
+
+    def save(self):
+        # write to a temporary file first so that a crash never leaves a
+        # half written index behind
+        saved = {'version': INDEX_VERSION, 'root': self.root,
+                 'directories': self.directories, 'table': self._get_table()}
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    def refresh(self):
+        # Brings the index up to date with the tree on disk and returns how
+        # many directories were checked and how many had to be scanned again.
+        start = time.perf_counter()
+        old = self.directories
+        new = {}
+        rescanned = 0
+        pending = [self.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            known = old.get(directory)
+            if known is not None and known[0] == mtime:
+                record = known
+            else:
+                rescanned += 1
+                names = []
+                subdirectories = []
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            names.append(entry.name)
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirectories.append(entry.name)
+                except OSError:
+                    pass
+                record = (mtime, tuple(names), tuple(subdirectories))
+            new[directory] = record
+            for name in record[2]:
+                pending.append(os.path.join(directory, name))
+
+        # directories that were not visited have been removed from the tree
+        if rescanned or len(new) != len(old):
+            self._table = None
+        self.directories = new
+        return {'directories': len(new), 'rescanned': rescanned,
+                'seconds': time.perf_counter() - start}
+
+    def _get_table(self):
+        if self._table is None:
+            by_name = {}
+            for directory, (_, names, _) in self.directories.items():
+                for name in names:
+                    by_name.setdefault(name, []).append(directory)
+            sorted_names = sorted(by_name)
+            # offsets[i] is where sorted_names[i] starts in the blob
+            offsets = []
+            position = 0
+            for name in sorted_names:
+                offsets.append(position)
+                position += len(name) + 1
+            blob = '\n'.join(sorted_names)
+            holders = [tuple(by_name[name]) for name in sorted_names]
+            self._table = (blob, offsets, holders)
+        return self._table
+
+    def search(self, file_name):
+        # Returns the paths of all the indexed entries whose name contains
+        # 'file_name', the same matches file_search() would find.
+        if not file_name or '\n' in file_name:
+            raise ValueError('file_name must be a non-empty single line')
+        blob, offsets, holders = self._get_table()
+        results = []
+        position = blob.find(file_name)
+        while position != -1:
+            i = bisect.bisect_right(offsets, position) - 1
+            name_end = offsets[i + 1] - 1 if i + 1 < len(offsets) \
+                else len(blob)
+            if position + len(file_name) <= name_end:
+                name = blob[offsets[i]:name_end]
+                for directory in holders[i]:
+                    results.append(os.path.join(directory, name))
+                # skip the rest of this name, it is already matched
+                position = blob.find(file_name, name_end + 1)
+            else:
+                # the occurrence spans the separator between two names
+                position = blob.find(file_name, position + 1)
+        return results
+
+
+def indexed_file_search(root, file_name, index_path=None, refresh=True):
+    # Loads the index of 'root', refreshes it when asked to, saves it back
+    # if anything changed and returns the matching paths.
+    index = FileSearchIndex.load(root, index_path)
+    if refresh or not index.directories:
+        stats = index.refresh()
+        if stats['rescanned'] or index._table is None:
+            index.save()
+    return index.search(file_name)
+
+
+def main():
+    for m in indexed_file_search("C:/Program Files/", "7z.exe"):
+        print('Matched: ', m)
+
+
+if __name__ == '__main__':
+    main()
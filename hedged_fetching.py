@@ -0,0 +1,208 @@
+# HEDGED AND DEADLINE-AWARE FETCHING
+
+# In inter_thread_communication.main() the time taken by the whole batch of
+# 20 documents is the time taken by the slowest of the 20 downloads, and
+# since urlopen() is called without a timeout, a single stalled server can
+# block the batch forever. Two techniques are used here to cut this tail:
+
+# - Hedged requests: when a download is still running after the time in
+#   which most downloads complete (a percentile of the latencies observed so
+#   far), a second, identical request is sent. Whichever of the two completes
+#   first is used and the other one is cancelled. A download is only slow by
+#   bad luck most of the time (a busy server thread, a lost packet), so the
+#   duplicate usually completes long before the original would have.
+# - Batch deadlines: the batch waits at most 'deadline' seconds. Downloads
+#   still running by then are cancelled and reported as missed, instead of
+#   holding up the results of all the others.
+
+# The downloads run on the asyncio fetcher from async_fetching.py, where
+# cancelling a task also closes its connection, and every attempt counts its
+# document into its own frequency table so that the two attempts of a hedged
+# request are never counted twice.
+
+# The latencies, and so the hedge delay, are measured from the moment an
+# attempt has acquired a connection, not from when it was submitted: time
+# spent waiting for the concurrency limit or for a free connection to the
+# host is local queueing, which a duplicate request would have to wait for
+# as well. The first attempt gets its full hedge delay once it is connected.
+# An attempt cancelled because the other one won (or because of the deadline)
+# is still recorded, with the time it had been running: its real latency was
+# at least that long, and leaving out the slow ones would make the
+# percentile, and so the hedge delay, too low.
+
+import asyncio
+import math
+import time
+from collections import deque
+
+from async_fetching import AsyncFetcher, HTTPError
+from letter_counting import LETTERS, count_bytes
+
+DEFAULT_HEDGE_PERCENTILE = 95
+# hedge delay used until enough latencies have been observed
+DEFAULT_HEDGE_DELAY = 0.5
+MIN_HEDGE_DELAY = 0.01
+MIN_SAMPLES = 20
+LATENCY_WINDOW = 1000
+
+
+def percentile(values, p):
+    # nearest-rank percentile of a non-empty list of values
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered)) - 1
+    rank = max(0, min(len(ordered) - 1, rank))
+    return ordered[rank]
+
+
+class HedgedFetcher:
+
+    def __init__(self, hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+                 **fetcher_options):
+        # hedge_percentile=None disables hedging
+        self.fetcher = AsyncFetcher(**fetcher_options)
+        self.hedge_percentile = hedge_percentile
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batch_latencies = []
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.missed = 0
+
+    def hedge_delay(self):
+        if len(self.latencies) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return max(MIN_HEDGE_DELAY,
+                   percentile(self.latencies, self.hedge_percentile))
+
+    async def _attempt(self, url, connected):
+        # 'connected' is a future set to the time at which the attempt first
+        # acquired a connection
+        frequency = dict.fromkeys(LETTERS, 0)
+
+        def on_connected():
+            if not connected.done():
+                connected.set_result(time.perf_counter())
+
+        await self.fetcher.fetch(url, lambda data: count_bytes(data,
+                                                               frequency),
+                                 on_connected)
+        return frequency
+
+    def _start_attempt(self, url, attempts):
+        connected = asyncio.get_running_loop().create_future()
+        attempt = asyncio.ensure_future(self._attempt(url, connected))
+        attempts[attempt] = connected
+        return attempt
+
+    async def count_letters(self, url):
+        # attempt task -> future of the time it acquired a connection
+        attempts = {}
+        first = self._start_attempt(url, attempts)
+        try:
+            if self.hedge_percentile is not None:
+                # the hedge delay starts once the first attempt is connected
+                await asyncio.wait([first, attempts[first]],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not first.done():
+                    done, _ = await asyncio.wait([first],
+                                                 timeout=self.hedge_delay())
+                    if not done:
+                        self.hedges += 1
+                        self._start_attempt(url, attempts)
+            error = None
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is not first:
+                            self.hedge_wins += 1
+                        self.latencies.append(time.perf_counter() -
+                                              attempts[attempt].result())
+                        return attempt.result()
+                    error = error or attempt.exception()
+            # every attempt failed
+            raise error
+        finally:
+            # cancel the loser, or every attempt when we were cancelled, and
+            # record how long the connected ones had been running. They are
+            # awaited, so that they have closed their connections when we
+            # return and none is left pending when the loop shuts down.
+            now = time.perf_counter()
+            losers = []
+            for attempt, connected in attempts.items():
+                if attempt.done():
+                    continue
+                attempt.cancel()
+                losers.append(attempt)
+                if connected.done():
+                    self.latencies.append(now - connected.result())
+            await asyncio.gather(*losers, return_exceptions=True)
+
+    async def count_batch(self, urls, deadline=None):
+        # Counts the letters of all the documents together. Returns the
+        # frequency table, the list of (url, error) of the failed downloads
+        # and the list of urls that missed the deadline (in seconds).
+        start = time.perf_counter()
+        tasks = {asyncio.ensure_future(self.count_letters(url)): url
+                 for url in urls}
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        # let the cancelled tasks close their connections
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.batch_latencies.append(time.perf_counter() - start)
+
+        frequency = dict.fromkeys(LETTERS, 0)
+        errors = []
+        for task in done:
+            error = task.exception()
+            if error is not None:
+                if not isinstance(error, (OSError, HTTPError,
+                                          asyncio.TimeoutError)):
+                    raise error
+                errors.append((tasks[task], error))
+                continue
+            for letter, count in task.result().items():
+                frequency[letter] += count
+        missed = [tasks[task] for task in pending]
+        self.missed += len(missed)
+        return frequency, errors, missed
+
+    def report(self):
+        stats = {'batches': len(self.batch_latencies), 'hedges': self.hedges,
+                 'hedge_wins': self.hedge_wins, 'missed': self.missed}
+        if self.batch_latencies:
+            stats['p50'] = percentile(self.batch_latencies, 50)
+            stats['p99'] = percentile(self.batch_latencies, 99)
+            stats['max'] = max(self.batch_latencies)
+        return stats
+
+    def close(self):
+        self.fetcher.close()
+
+
+def main():
+    urls = [f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
+            for i in range(1000, 1020)]
+
+    async def run():
+        fetcher = HedgedFetcher(timeout=10)
+        try:
+            return await fetcher.count_batch(urls, deadline=15)
+        finally:
+            fetcher.close()
+
+    start = time.time()
+    frequency, errors, missed = asyncio.run(run())
+    end = time.time()
+    for url, error in errors:
+        print('Failed: ', url, error)
+    for url in missed:
+        print('Missed the deadline: ', url)
+    print(frequency)
+    print('Done, time taken: ', end - start)
+
+
+if __name__ == '__main__':
+    main()
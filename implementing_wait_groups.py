@@ -11,3 +11,77 @@
 # a "wait group" which simply keeps a condition variable that acts
 # as a count of the currently active child threads. when this count reaches
 # 0, the parent thread can continue with its other execution tasks.
+
+from threading import Thread, Condition
+
+
+class WaitGroup:
+    # The wait group is just a counter protected by a conditional variable.
+    # add() increments the counter before a unit of work is handed out,
+    # done() decrements it once that work is completed and wait() blocks
+    # the calling thread until the counter drops back to 0. Only the call
+    # that brings the counter to 0 broadcasts to the waiting threads, so
+    # waiters are woken up exactly once instead of polling the counter.
+
+    def __init__(self):
+        self.count = 0
+        self.cv = Condition()
+
+    def add(self, count=1):
+        self.cv.acquire()
+        try:
+            if self.count + count < 0:
+                raise ValueError('WaitGroup counter cannot go negative')
+            self.count += count
+            if self.count == 0:
+                # wake up every thread blocked in wait()
+                self.cv.notify_all()
+        finally:
+            self.cv.release()
+
+    def done(self):
+        self.add(-1)
+
+    def wait(self, timeout=None):
+        # Returns True when the counter reached 0 and False when the timeout
+        # (in seconds) expired before that happened.
+        self.cv.acquire()
+        try:
+            return self.cv.wait_for(lambda: self.count == 0, timeout)
+        finally:
+            self.cv.release()
+
+    def go(self, target, *args):
+        # Convenience wrapper that registers the work, runs 'target' in a
+        # new Thread and marks the work done even if 'target' raises.
+        self.add(1)
+
+        def run():
+            try:
+                target(*args)
+            finally:
+                self.done()
+
+        t = Thread(target=run, args=())
+        try:
+            t.start()
+        except BaseException:
+            # run() will never call done(), without this wait() would block
+            # forever on work that was never started
+            self.done()
+            raise
+        return t
+
+    # Using the wait group as a context manager makes the parent thread wait
+    # for all the work started inside the 'with' block when leaving it:
+    #
+    #   with WaitGroup() as wg:
+    #       for url in urls:
+    #           wg.go(count_letters, url, frequency)
+    #   # all count_letters() calls have completed here
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wait()
+        return False
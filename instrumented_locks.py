@@ -0,0 +1,405 @@
+# INSTRUMENTED LOCKS AND CONDITION VARIABLES
+
+# race_condition_example.StingySpendySynchronized and
+# synchronization_using_conditional_vars.StingySpendyConditional acquire and
+# release their mutex or conditional variable in tight loops, but nothing
+# tells us how much of that time the Threads spend waiting for each other.
+# The classes here are drop-in replacements for threading.Lock, RLock and
+# Condition that keep, for every place in the code a lock is acquired from
+# (its call site):
+#
+# - how many acquisitions there were, and how many were contended, that is,
+#   had to wait because another Thread held the lock,
+# - a histogram of the time spent waiting for the lock,
+# - a histogram of the time the lock was then held,
+# - for conditional variables, how many times waiting Threads were woken up
+#   and how many of those wake-ups were spurious: the Thread found its
+#   condition still false and went back to waiting.
+#
+# To instrument an existing class, replace its lock:
+#
+#   StingySpendyConditional.cv = InstrumentedCondition(name='account')
+#   report_at_exit()
+#
+# An uncontended acquisition only costs a non-blocking acquire() and a
+# counter increment in the default 'sampled' mode; only one in every
+# 'sample_every' of them is timed and attributed to its call site. Contended
+# acquisitions have already spent time waiting, so they are always timed.
+# The 'full' mode times every acquisition. The default mode can be set with
+# the LOCK_INSTRUMENTATION environment variable.
+#
+# Even so, these are Python methods wrapped around a lock implemented in C:
+# an uncontended acquire() and release() pair takes about 0.5 to 1.1 us in
+# the 'sampled' mode, against about 0.15 us for a bare threading.Lock, so 4
+# to 7 times as long, and 'full' is several times slower again. That is
+# nothing next to a contended wait, but it shows in a loop that takes an
+# uncontended lock millions of times. The 'off' mode, the one to leave in
+# production code, therefore costs nothing at all: InstrumentedLock,
+# InstrumentedRLock and InstrumentedCondition then create the plain
+# threading.Lock, RLock and Condition, with no wrapper around them, so
+# LOCK_INSTRUMENTATION=sampled can be set only when contention is being
+# looked into. Run 'python instrumented_locks.py' to measure the modes on
+# your machine.
+
+# The statistics of a lock are only ever updated by the Thread holding that
+# lock, so they need no lock of their own.
+
+import atexit
+import os
+import sys
+import threading
+import time
+from threading import get_ident
+
+MODES = ('off', 'sampled', 'full')
+DEFAULT_MODE = os.environ.get('LOCK_INSTRUMENTATION', 'sampled')
+DEFAULT_SAMPLE_EVERY = 64
+# histogram bucket i counts durations below 2**i nanoseconds
+HISTOGRAM_BUCKETS = 40
+
+_registry = []
+_registry_lock = threading.Lock()
+# frames of threading.py and of the methods of the instrumented classes are
+# skipped when looking for the call site, see the end of the module
+_SKIP_FILE = threading.__file__
+_SKIP_CODES = set()
+
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None and (frame.f_code in _SKIP_CODES or
+                                 frame.f_code.co_filename == _SKIP_FILE):
+        frame = frame.f_back
+    if frame is None:
+        return '<unknown>'
+    return f'{frame.f_code.co_filename}:{frame.f_lineno} ' \
+        f'({frame.f_code.co_name})'
+
+
+def _bucket(ns):
+    return min(HISTOGRAM_BUCKETS - 1, ns.bit_length())
+
+
+def _percentile(histogram, p):
+    # upper bound, in nanoseconds, of the bucket holding the percentile
+    total = sum(histogram)
+    if not total:
+        return 0
+    rank = p / 100 * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return (1 << i) - 1
+    return 1 << (HISTOGRAM_BUCKETS - 1)
+
+
+def _us(ns):
+    return f'{ns / 1000:.1f} us'
+
+
+class SiteStats:
+
+    def __init__(self, site):
+        self.site = site
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_ns = 0
+        self.hold_ns = 0
+        self.holds = 0
+        self.wait_histogram = [0] * HISTOGRAM_BUCKETS
+        self.hold_histogram = [0] * HISTOGRAM_BUCKETS
+        self.wakeups = 0
+        self.spurious_wakeups = 0
+
+    def record_wait(self, ns):
+        self.wait_ns += ns
+        self.wait_histogram[_bucket(ns)] += 1
+
+    def record_hold(self, ns):
+        self.holds += 1
+        self.hold_ns += ns
+        self.hold_histogram[_bucket(ns)] += 1
+
+
+class LockStats:
+
+    def __init__(self, name, kind, mode, sample_every):
+        self.name = name
+        self.kind = kind
+        self.mode = mode
+        self.sample_every = sample_every
+        self.acquisitions = 0
+        self.contended = 0
+        self.wakeups = 0
+        self.spurious_wakeups = 0
+        self.sites = {}
+
+    def site(self, site):
+        stats = self.sites.get(site)
+        if stats is None:
+            stats = self.sites[site] = SiteStats(site)
+        return stats
+
+
+class InstrumentedLock:
+    kind = 'Lock'
+    _factory = threading.Lock
+
+    def __new__(cls, name=None, mode=None, sample_every=None):
+        if (mode or DEFAULT_MODE) == 'off':
+            # nothing is recorded, so the real lock is handed out instead of
+            # a wrapper that would only add the cost of a Python call
+            return cls._factory()
+        return super().__new__(cls)
+
+    def __init__(self, name=None, mode=None, sample_every=None):
+        self.mode = mode or DEFAULT_MODE
+        if self.mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}')
+        self.sample_every = sample_every or DEFAULT_SAMPLE_EVERY
+        self._lock = self._factory()
+        self._tick = 0
+        self._owner = None
+        self._depth = 0
+        # set while the current hold is being timed
+        self._hold_site = None
+        self._hold_start = 0
+        # the Thread that woke up from a wait() and has not released the lock
+        # since, see InstrumentedCondition.wait()
+        self._woken = None
+        self.stats = LockStats(name or f'{self.kind}@{id(self):#x}',
+                               self.kind, self.mode, self.sample_every)
+        with _registry_lock:
+            _registry.append(self.stats)
+
+    def acquire(self, blocking=True, timeout=-1):
+        lock = self._lock
+        if lock.acquire(False):
+            waited = None
+        elif not blocking:
+            return False
+        else:
+            start = time.perf_counter_ns()
+            if not lock.acquire(True, timeout):
+                return False
+            waited = time.perf_counter_ns() - start
+
+        # from here on we hold the lock
+        self._owner = get_ident()
+        self._depth += 1
+        stats = self.stats
+        stats.acquisitions += 1
+        if self._depth > 1:
+            # reentrant acquisition of an RLock, nothing was waited for
+            return True
+        if waited is None:
+            self._tick += 1
+            if self.mode == 'sampled' and self._tick % self.sample_every:
+                return True
+        site = stats.site(_call_site())
+        site.acquisitions += 1
+        if waited is None:
+            site.record_wait(0)
+        else:
+            stats.contended += 1
+            site.contended += 1
+            site.record_wait(waited)
+        self._hold_site = site
+        self._hold_start = time.perf_counter_ns()
+        return True
+
+    __enter__ = acquire
+
+    def release(self):
+        # checked before touching the bookkeeping, which belongs to the
+        # Thread holding the lock
+        if self._depth == 0:
+            raise RuntimeError('release unlocked lock')
+        if self._depth == 1:
+            if self._hold_site is not None:
+                self._hold_site.record_hold(time.perf_counter_ns()
+                                            - self._hold_start)
+                self._hold_site = None
+            self._owner = None
+            self._woken = None
+        self._depth -= 1
+        self._lock.release()
+
+    def locked(self):
+        return self._depth > 0
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    # used by threading.Condition to release the lock completely while
+    # waiting and to take it back afterwards
+    def _is_owned(self):
+        return self._owner == get_ident()
+
+    def _release_save(self):
+        depth = self._depth
+        woken = self._woken
+        for _ in range(depth):
+            self.release()
+        return depth, woken
+
+    def _acquire_restore(self, state):
+        depth, woken = state
+        for _ in range(depth):
+            self.acquire()
+        self._woken = woken
+
+
+class InstrumentedRLock(InstrumentedLock):
+    kind = 'RLock'
+    _factory = threading.RLock
+
+    def release(self):
+        # unlike a Lock, an RLock can only be released by its owner
+        if self._owner != get_ident():
+            raise RuntimeError('cannot release un-acquired lock')
+        super().release()
+
+
+class InstrumentedCondition(threading.Condition):
+
+    def __new__(cls, lock=None, name=None, mode=None, sample_every=None):
+        # with the 'off' mode, or a lock created with it (a plain lock), it
+        # is a plain threading.Condition
+        if lock is None:
+            off = (mode or DEFAULT_MODE) == 'off'
+        else:
+            off = not isinstance(lock, InstrumentedLock) and \
+                mode in (None, 'off')
+        if off:
+            return threading.Condition(lock)
+        return super().__new__(cls)
+
+    def __init__(self, lock=None, name=None, mode=None, sample_every=None):
+        if lock is None:
+            # threading.Condition uses an RLock by default too
+            lock = InstrumentedRLock(name, mode, sample_every)
+        elif not isinstance(lock, InstrumentedLock):
+            raise TypeError('lock must be an InstrumentedLock or '
+                            'InstrumentedRLock')
+        lock.stats.kind = 'Condition'
+        super().__init__(lock)
+
+    @property
+    def stats(self):
+        return self._lock.stats
+
+    def wait(self, timeout=None):
+        lock = self._lock
+        me = get_ident()
+        if lock._woken == me:
+            # we were woken up, found our condition still false and are
+            # going back to sleep without having released the lock
+            lock.stats.spurious_wakeups += 1
+            lock.stats.site(_call_site()).spurious_wakeups += 1
+        notified = super().wait(timeout)
+        lock.stats.wakeups += 1
+        lock.stats.site(_call_site()).wakeups += 1
+        lock._woken = me if notified else None
+        return notified
+
+
+_SKIP_CODES.update(f.__code__ for f in [
+    InstrumentedLock.acquire, InstrumentedLock._release_save,
+    InstrumentedLock._acquire_restore, InstrumentedCondition.wait])
+
+
+def report():
+    # Returns the report of every instrumented lock created so far. In the
+    # 'sampled' mode the per call site counts of uncontended acquisitions
+    # only include the sampled ones.
+    lines = []
+    with _registry_lock:
+        all_stats = list(_registry)
+    for stats in all_stats:
+        if not stats.acquisitions:
+            continue
+        share = stats.contended / stats.acquisitions
+        lines.append(f'{stats.kind} {stats.name} ({stats.mode}): '
+                     f'{stats.acquisitions} acquisitions, '
+                     f'{stats.contended} contended ({share:.1%})')
+        if stats.kind == 'Condition':
+            lines.append(f'    {stats.wakeups} wakeups, '
+                         f'{stats.spurious_wakeups} spurious')
+        sites = sorted(stats.sites.values(), key=lambda s: s.wait_ns,
+                       reverse=True)
+        for site in sites:
+            timed = max(1, sum(site.wait_histogram))
+            wait_p50 = _percentile(site.wait_histogram, 50)
+            wait_p99 = _percentile(site.wait_histogram, 99)
+            hold_p99 = _percentile(site.hold_histogram, 99)
+            lines.append(f'  {site.site}')
+            lines.append(
+                f'    acquisitions {site.acquisitions} '
+                f'(contended {site.contended})  '
+                f'wait: mean {_us(site.wait_ns / timed)}, '
+                f'p50 <= {_us(wait_p50)}, p99 <= {_us(wait_p99)}  '
+                f'hold: mean {_us(site.hold_ns / max(1, site.holds))}, '
+                f'p99 <= {_us(hold_p99)}')
+            if site.wakeups or site.spurious_wakeups:
+                lines.append(f'    wakeups {site.wakeups}, '
+                             f'spurious {site.spurious_wakeups}')
+    return '\n'.join(lines)
+
+
+def dump_report(file=None):
+    text = report()
+    if text:
+        print(text, file=file or sys.stderr)
+
+
+def report_at_exit(file=None):
+    atexit.register(dump_report, file)
+
+
+def main():
+    # Overhead of an uncontended acquire() and release() pair
+    iterations = 1000000
+    print('Uncontended acquire/release:')
+    for label, lock in [('threading.Lock', threading.Lock()),
+                        ('off', InstrumentedLock('off', 'off')),
+                        ('sampled', InstrumentedLock('sampled', 'sampled')),
+                        ('full', InstrumentedLock('full', 'full'))]:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            lock.acquire()
+            lock.release()
+        elapsed = time.perf_counter() - start
+        print(f'{label:>16}: {elapsed / iterations * 1e9:8.0f} ns')
+
+    # The balance pattern of StingySpendyConditional, on a smaller scale
+    cv = InstrumentedCondition(name='account')
+    balance = [100]
+
+    def stingy():
+        for _ in range(100000):
+            with cv:
+                balance[0] += 10
+                cv.notify()
+
+    def spendy():
+        for _ in range(50000):
+            with cv:
+                while balance[0] < 20:
+                    cv.wait()
+                balance[0] -= 20
+
+    threads = [threading.Thread(target=stingy),
+               threading.Thread(target=spendy)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print('Money in the end: ', balance[0])
+    print()
+    dump_report(sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,10 +13,15 @@
 # problem to be solved.
 
 
+import gzip
 import json
+import multiprocessing
 import urllib.request
 import time
-from threading import Thread, Lock
+from multiprocessing.pool import ThreadPool
+
+from letter_counting import LETTERS, count_bytes
+from pipeline import Pipeline, Stage, format_report
 
 
 # Here we implement a letter function to calculate the frequency of
@@ -27,32 +32,41 @@ from threading import Thread, Lock
 finished_count = 0
 
 
-def count_letters(url, frequency):
+def fetch(url):
     req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
     response = urllib.request.urlopen(req)
-    txt = str(response.read())
+    return response.read()
+
+
+# The original way of counting: convert the bytes to a string and loop over
+# every character in Python. Note that str() of a bytes object gives its
+# repr, so escape sequences like '\\n' are counted as letters too.
+def count_text(txt, frequency):
     for char in txt:
         letter = char.lower()
         if letter in frequency:
             frequency[letter] += 1
+
+
+# count_bytes() from letter_counting.py counts the raw bytes of the document
+# in C and then adds the 26 counts to the frequency table.
+def count_letters(url, frequency):
+    count_bytes(fetch(url), frequency)
     global finished_count
     finished_count += 1
 
 
 def count_letters_synchronized(url, frequency, mutex):
-    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-    response = urllib.request.urlopen(req)
-    txt = str(response.read())
+    data = fetch(url)
+    counts = count_bytes(data)
     # It turns out that the code is more performant when the mutex is acquired
     # only once here instead of acquiring the mutex for every letter in the
-    # frequency table
+    # frequency table. Note that a Lock is not reentrant: acquiring it again
+    # for every letter while already holding it here would deadlock the
+    # thread on its own lock.
     mutex.acquire()
-    for char in txt:
-        letter = char.lower()
-        if letter in frequency:
-            mutex.acquire()
-            frequency[letter] += 1
-            mutex.release()
+    for letter, count in counts.items():
+        frequency[letter] += count
     global finished_count
     finished_count += 1
     # finished_count is also shared between the threads and hence, we release
@@ -60,51 +74,192 @@ def count_letters_synchronized(url, frequency, mutex):
     mutex.release()
 
 
+# count_letters() reads the whole body of the response into memory before
+# counting it, so the memory used by every thread grows with the size of the
+# document it downloads. The streaming version below reads the response in
+# chunks of a fixed size into one buffer that is reused for every chunk, with
+# readinto(), and counts each chunk as soon as it has arrived. The memory used
+# per download stays the same whatever the size of the document, and while a
+# chunk is being counted the operating system keeps receiving the next one
+# into the socket buffer, so counting overlaps with the network transfer.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def count_letters_streaming(url, frequency, chunk_size=STREAM_CHUNK_SIZE):
+    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    buffer = bytearray(chunk_size)
+    counts = dict.fromkeys(LETTERS, 0)
+    with urllib.request.urlopen(req) as response, memoryview(buffer) as view:
+        while True:
+            n = response.readinto(buffer)
+            if not n:
+                break
+            with view[:n] as chunk:
+                count_bytes(chunk, counts)
+    for letter, count in counts.items():
+        frequency[letter] += count
+    global finished_count
+    finished_count += 1
+
+
+# Even the synchronized version above makes all the threads take turns on
+# one shared dictionary. A better way is to not share the frequency table
+# at all while counting: every worker counts its document into its own
+# private table (the 'map' step) and the tables are added together once, at
+# the end (the 'reduce' step). No lock is needed because no table is ever
+# written by two workers, and since the workers share nothing, they can be
+# Processes as well as Threads.
+
+def count_letters_local(url):
+    return count_bytes(fetch(url))
+
+
+def merge_frequencies(tables):
+    total = dict.fromkeys(LETTERS, 0)
+    for table in tables:
+        for letter, count in table.items():
+            total[letter] += count
+    return total
+
+
+def count_letters_map_reduce(urls, workers=20, use_processes=False,
+                             mapper=count_letters_local, executor=None):
+    # 'mapper' is called with every item of 'urls' and must return a
+    # frequency table. With use_processes=True it has to be a module-level
+    # function so that it can be sent to the worker Processes. With an
+    # Executor from executors.py, the executor picks the backend instead.
+    if executor is not None:
+        return merge_frequencies(executor.map(mapper, urls))
+    if use_processes:
+        pool = multiprocessing.Pool(workers)
+    else:
+        pool = ThreadPool(workers)
+    with pool:
+        return merge_frequencies(pool.imap_unordered(mapper, urls))
+
+
+# The whole job as a pipeline (see pipeline.py): fetch -> decode -> count
+# -> merge. Every stage has its own number of worker threads: many for
+# fetching, which mostly waits for the network, few for decoding and
+# counting, which keep a core busy, and a single one for merging, so the
+# frequency table is only ever written by one thread and needs no mutex.
+# The stages are connected by bounded queues. When counting falls behind,
+# the fetchers block instead of piling up downloaded documents, and the
+# URLs are only taken from 'urls' as fast as the pipeline can absorb them,
+# so 'urls' can be a generator of any length and the memory used stays
+# bounded.
+
+def fetch_encoded(url):
+    # The server may send the document compressed, which is then decompressed
+    # in the decode stage instead of by the fetching thread
+    req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0',
+                                               'Accept-Encoding': 'gzip'})
+    with urllib.request.urlopen(req) as response:
+        return response.read(), response.headers.get('Content-Encoding')
+
+
+def decode(response):
+    data, encoding = response
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    return data
+
+
+def count_letters_pipeline(urls, frequency, fetch_workers=20,
+                           decode_workers=1, count_workers=2, capacity=8):
+    # Adds the counts of every document of 'urls' to 'frequency' and returns
+    # the Pipeline, whose report() tells where the time went. Failed fetches
+    # are listed in its 'errors', by url.
+    def merge(counts):
+        for letter, count in counts.items():
+            frequency[letter] += count
+
+    pipeline = Pipeline([
+        Stage('fetch', fetch_encoded, fetch_workers, capacity, key=str),
+        Stage('decode', decode, decode_workers, capacity),
+        Stage('count', count_bytes, count_workers, capacity),
+        Stage('merge', merge, 1, capacity),
+    ])
+    pipeline.run(urls)
+    return pipeline
+
+
 def main():
     # initialize the frequency dictionary
     frequency = {}
-    mutex = Lock()
-    for c in 'abcdefghijklmnopqrstuvwxyz':
+    for c in LETTERS:
         frequency[c] = 0
 
     start = time.time()
-    for i in range(1000, 1020):
-        rfc_url = f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
-
-        # To perform a synchronized multi-threaded computation of 20 text urls
-        Thread(target=count_letters, args=(rfc_url, frequency)).start()
-        # To perform a synchronized multi-threaded computation of 20 text urls
-        Thread(target=count_letters_synchronized, args=(rfc_url, frequency))\
-            .start()
-        # NOTE: the threads will be created, but the loop will not wait
-        # until all threads finish. So, for our end time measurement,
-        # we need to wait until all threads complete using a global
-        # count of the finished threads.
-
-        # To Perform a single-threaded computation of 20 text urls
-        # count_letters(rfc_url, frequency)
-
-    # wait till all 20 calls to count_letters() completes in the 20 spawned
-    # threads. Checks status every 0.5 sec.
-    # while finished_count < 20:
-    #     time.sleep(0.5)
+    # The URLs are generated as the pipeline asks for them
+    urls = (f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
+            for i in range(1000, 1020))
+    pipeline = count_letters_pipeline(urls, frequency)
+    end = time.time()
+    print(format_report(pipeline.report()))
+    for stage, url, error in pipeline.errors:
+        print('Failed', stage, url, error)
+
+    # Alternatively, one thread per url doing all the steps itself. The wait
+    # group keeps count of the running count_letters() calls so that the
+    # main thread can sleep until the last of them completes (WaitGroup is
+    # in implementing_wait_groups.py):
+    # wait_group = WaitGroup()
+    # mutex = threading.Lock()
+    # for i in range(1000, 1020):
+    #     rfc_url = f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
+    #     # To perform an unsynchronized multi-threaded computation of 20
+    #     # text urls
+    #     wait_group.go(count_letters, rfc_url, frequency)
+    #     # To perform a synchronized multi-threaded computation of 20 text
+    #     # urls
+    #     # wait_group.go(count_letters_synchronized, rfc_url, frequency,
+    #     #               mutex)
+    #     # To Perform a single-threaded computation of 20 text urls
+    #     # count_letters(rfc_url, frequency)
+    # NOTE: the threads will be created, but the loop will not wait until all
+    # threads finish. So, for our end time measurement, we need to wait until
+    # all threads complete.
+    # Polling finished_count every 0.5 sec (while finished_count < 20:
+    # time.sleep(0.5)) adds up to half a second to the measured time and,
+    # when the check is done while holding the mutex, competes with the
+    # worker threads for that same mutex. The wait group instead wakes up the
+    # main thread as soon as the last thread calls done().
+    # wait_group.wait()
     # end = time.time()
 
-    # We can use the mutex lock itself to check if all threads have completed
-    # computation, instead of using time.sleep() to check every 0.5 sec
-    while True:
-        mutex.acquire()
-        if finished_count == 20:
-            break
-        mutex.release()
-        time.sleep(0.5)
-    end = time.time()
+    # To perform a map-reduce computation of 20 text urls, where no
+    # frequency table is shared between the threads:
+    # frequency = count_letters_map_reduce(
+    #     [f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
+    #      for i in range(1000, 1020)])
+
+    # To fetch the 20 text urls with asyncio tasks in this thread, reusing
+    # keep-alive connections to the host, see async_fetching.py:
+    # frequency, errors = asyncio.run(count_letters_async(
+    #     [f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
+    #      for i in range(1000, 1020)]))
+
+    # To let an Executor measure that fetching is I/O-bound and choose
+    # Threads for it, see executors.py:
+    # with Executor() as executor:
+    #     frequency = count_letters_map_reduce(
+    #         [f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
+    #          for i in range(1000, 1020)], executor=executor)
+
+    # To skip downloading and counting documents that were already counted
+    # in an earlier run, see document_cache.py:
+    # frequency = count_letters_map_reduce(
+    #     [f'https://www.rfc-editor.org/rfc/rfc{i}.txt'
+    #      for i in range(1000, 1020)],
+    #     mapper=DocumentCache().count_letters)
 
     print(json.dumps(frequency, indent=4))
     print('Done, time taken: ', end - start)
 
 
-main()
+if __name__ == '__main__':
+    main()
 
 # If you examine the results of the threads running in parallel and
 # single-thread execution, you will notice that the counts donot match.
@@ -0,0 +1,152 @@
+# A LOCAL STAND-IN FOR THE RFC DOCUMENT SERVER
+
+# The letter counting examples in inter_thread_communication.py download
+# their documents from www.rfc-editor.org. To measure them without depending
+# on the network, this module runs a small HTTP server on localhost that
+# serves synthetic documents of any size at the same kind of paths:
+#
+#   http://127.0.0.1:<port>/rfc1000.txt?size=50000000
+#
+# The content of a document only depends on its name, so the expected letter
+# counts can be computed without downloading it, and the body is generated
+# while it is sent, so even very large documents take no memory on the
+# server. The server speaks HTTP/1.1 with a Content-Length, so clients can
+# keep their connections alive between requests. Documents never change, so
+# every response carries an ETag and a Last-Modified date, and conditional
+# requests are answered with '304 Not Modified'. The server counts the
+# requests it receives, so callers can check how much network I/O they did.
+# To study tail latency, a random fraction of the requests can be delayed
+# before they are answered.
+
+import random
+import string
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from letter_counting import count_bytes
+
+DEFAULT_DOCUMENT_SIZE = 100000
+BLOCK_SIZE = 64 * 1024
+# the documents never change
+LAST_MODIFIED = 'Thu, 01 Jan 1987 00:00:00 GMT'
+_ALPHABET = (string.ascii_letters + string.digits + ' \n.,;-').encode()
+
+
+def document_block(name):
+    # the body of a document is this block repeated until the size is reached
+    return bytes(random.Random(name).choices(_ALPHABET, k=BLOCK_SIZE))
+
+
+def expected_frequency(name, size=DEFAULT_DOCUMENT_SIZE):
+    block = document_block(name)
+    full_blocks, rest = divmod(size, BLOCK_SIZE)
+    frequency = count_bytes(block)
+    for letter in frequency:
+        frequency[letter] *= full_blocks
+    return count_bytes(block[:rest], frequency)
+
+
+class DocumentHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        size = int(query.get('size', [self.server.document_size])[0])
+        name = url.path.lstrip('/')
+        etag = f'"{name}-{size}"'
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.slow_fraction \
+                and random.random() < self.server.slow_fraction:
+            time.sleep(self.server.slow_delay)
+
+        if self.headers.get('If-None-Match') == etag \
+                or 'If-Modified-Since' in self.headers:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        block = document_block(name)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(size))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.end_headers()
+        remaining = size
+        while remaining > 0:
+            n = min(remaining, BLOCK_SIZE)
+            self.wfile.write(block[:n])
+            remaining -= n
+
+    def log_message(self, format, *args):
+        # keep benchmark output readable
+        pass
+
+
+class DocumentServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def handle_error(self, request, client_address):
+        # clients that give up on a download, or close kept-alive
+        # connections, are expected and not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class LocalDocumentServer:
+    # Runs the document server in a background thread:
+    #
+    #   with LocalDocumentServer() as server:
+    #       count_letters(server.url('rfc1000.txt'), frequency)
+
+    def __init__(self, document_size=DEFAULT_DOCUMENT_SIZE, slow_fraction=0.0,
+                 slow_delay=1.0):
+        # 'slow_fraction' of the requests, chosen at random, are answered
+        # only after 'slow_delay' seconds
+        self.httpd = DocumentServer(('127.0.0.1', 0), DocumentHandler)
+        self.httpd.document_size = document_size
+        self.httpd.slow_fraction = slow_fraction
+        self.httpd.slow_delay = slow_delay
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       args=(), daemon=True)
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def url(self, name, size=None):
+        url = f'http://127.0.0.1:{self.port}/{name}'
+        if size is not None:
+            url += f'?size={size}'
+        return url
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
@@ -0,0 +1,179 @@
+# A MULTI-PROCESS FILE SEARCH THAT STREAMS ITS MATCHES
+
+# Even with a fixed pool of worker threads, file_search() in using_joins.py
+# spends most of its time matching names in Python code, which only one
+# thread can run at a time because of the GIL. Here the search is spread over
+# several Processes, and each Process has its own interpreter and its own GIL.
+
+# The top-level subdirectories of the root are handed out to the worker
+# Processes as tasks through a shared task queue. A subtree can turn out to be
+# much larger than the others, so a worker that sees other workers sitting
+# idle gives half of the directories it still has to search back to the
+# parent Process, which puts them on the task queue for the idle workers.
+
+# Instead of collecting everything in a global 'matches' list protected by a
+# mutex and handing it over after the whole walk, the workers send their
+# matches to the parent as soon as they find them, and parallel_file_search()
+# yields them to the caller through a generator.
+
+import multiprocessing
+import os
+import queue
+import time
+
+# number of directories a worker searches between two checks for idle workers
+REBALANCE_EVERY = 16
+# matches are sent to the parent in batches of this size, or sooner when
+# FLUSH_INTERVAL seconds have passed since the previous batch was sent
+MATCH_BATCH = 256
+FLUSH_INTERVAL = 0.05
+# seconds without any message from the workers after which the parent checks
+# that they are all still alive
+LIVENESS_INTERVAL = 1.0
+
+# messages sent from the workers to the parent Process
+MATCHES, SPLIT, DONE, ERROR = range(4)
+
+
+def _search_subtree(directory, file_name, idle, results):
+    pending = [directory]
+    found = []
+    last_flush = time.monotonic()
+    scanned = 0
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if file_name in entry.name:
+                        found.append(entry.path)
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+        except OSError:
+            pass
+        scanned += 1
+
+        now = time.monotonic()
+        if found and (len(found) >= MATCH_BATCH
+                      or now - last_flush >= FLUSH_INTERVAL):
+            results.put((MATCHES, found))
+            found = []
+            last_flush = now
+
+        # Rebalancing: give half of our pending directories away when some
+        # other worker has nothing to do
+        if scanned % REBALANCE_EVERY == 0 and len(pending) > 1 \
+                and idle.value > 0:
+            half = len(pending) // 2
+            results.put((SPLIT, pending[:half]))
+            del pending[:half]
+
+    if found:
+        results.put((MATCHES, found))
+
+
+def _worker(file_name, tasks, results, idle):
+    while True:
+        with idle.get_lock():
+            idle.value += 1
+        directory = tasks.get()
+        with idle.get_lock():
+            idle.value -= 1
+        if directory is None:
+            break
+        try:
+            _search_subtree(directory, file_name, idle, results)
+        except Exception as e:
+            results.put((ERROR, repr(e)))
+        # DONE is always sent after any SPLIT of the same task, so the parent
+        # can never count the outstanding tasks down to 0 too early
+        results.put((DONE, None))
+
+
+def parallel_file_search(root, file_name, processes=None):
+    # Generator yielding the path of every entry below 'root' whose name
+    # contains 'file_name', in the order in which the workers find them.
+    if processes is None:
+        processes = os.cpu_count() or 1
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    idle = multiprocessing.Value('i', 0)
+
+    # The root itself is searched by the parent Process, its subdirectories
+    # are the first tasks of the workers.
+    outstanding = 0
+    subdirectories = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if file_name in entry.name:
+                yield entry.path
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+    if not subdirectories:
+        return
+
+    workers = [multiprocessing.Process(target=_worker,
+                                       args=(file_name, tasks, results, idle),
+                                       daemon=True)
+               for _ in range(min(processes, len(subdirectories)))]
+    for p in workers:
+        p.start()
+    try:
+        for directory in subdirectories:
+            tasks.put(directory)
+            outstanding += 1
+
+        while outstanding:
+            try:
+                kind, payload = results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                # A worker killed by a signal or by the OOM killer never
+                # sends DONE for its task, so we would wait forever. No
+                # worker exits before its None task, which is only sent
+                # once nothing is outstanding.
+                for p in workers:
+                    if p.exitcode is not None:
+                        raise RuntimeError(
+                            f'file search worker {p.pid} died with exit '
+                            f'code {p.exitcode}')
+                continue
+            if kind == MATCHES:
+                yield from payload
+            elif kind == SPLIT:
+                for directory in payload:
+                    tasks.put(directory)
+                outstanding += len(payload)
+            elif kind == DONE:
+                outstanding -= 1
+            elif kind == ERROR:
+                raise RuntimeError(f'file search worker failed: {payload}')
+
+        for _ in workers:
+            tasks.put(None)
+        for p in workers:
+            p.join()
+    finally:
+        # the caller may stop iterating before the search is done, in which
+        # case directories may be left on the task queue that nobody reads
+        tasks.cancel_join_thread()
+        for p in workers:
+            if p.is_alive():
+                p.terminate()
+                p.join()
+
+
+def main():
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for m in parallel_file_search("C:/Program Files/", "7z.exe"):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+        print('Matched: ', m)
+    print('Time to first match: ', first)
+    print('Total time: ', time.perf_counter() - start, 'matches: ', count)
+
+
+if __name__ == '__main__':
+    main()
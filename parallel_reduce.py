@@ -0,0 +1,136 @@
+# SPLITTING A CPU-BOUND LOOP ACROSS PROCESSES
+
+# creating_processes.py starts 12 Processes that all run the same 20 million
+# iteration loop, and creating_threads.py runs that loop on several Threads,
+# where the GIL lets only one of them make progress at a time. Neither makes
+# one loop run faster. Here the range of the loop is split into chunks, the
+# chunks are handed out to a pool of worker Processes, and the partial
+# results of the chunks are combined with a reducer function:
+#
+#   total = parallel_reduce(count_iterations, range(20000000), operator.add)
+#
+# Choosing the chunk size is a trade-off. Every chunk costs a round trip to a
+# worker (pickling the arguments and the result and waking up the worker),
+# so very small chunks spend more time in dispatching than in computing. Very
+# large chunks leave workers idle at the end while the last few chunks are
+# still running (load imbalance). The chunk size is therefore tuned from a
+# short calibration run in the parent. The items are split so that every
+# worker gets CHUNKS_PER_WORKER chunks, which keeps the workers busy until
+# the end, unless those chunks would take less than MIN_CHUNK_SECONDS each.
+# Then the chunks are made that long instead, and the workers get fewer of
+# them: with so little work the dispatch overhead matters more than the
+# imbalance. The calibration run is part of the work, its result is not
+# thrown away.
+
+import multiprocessing
+import operator
+import os
+import time
+
+MIN_CHUNK_SECONDS = 0.02
+CHUNKS_PER_WORKER = 4
+CALIBRATION_SECONDS = 0.005
+
+
+def _calibrate(func, items):
+    # Runs func() on larger and larger prefixes of 'items' until one takes
+    # at least CALIBRATION_SECONDS. Returns the number of items done, their
+    # result and the measured time per item.
+    size = 1
+    done = 0
+    results = []
+    while True:
+        chunk = items[done:done + size]
+        start = time.perf_counter()
+        results.append(func(chunk))
+        elapsed = time.perf_counter() - start
+        done += len(chunk)
+        if elapsed >= CALIBRATION_SECONDS or done >= len(items):
+            return done, results, elapsed / len(chunk)
+        size *= 2
+
+
+def choose_chunk_size(item_count, seconds_per_item, workers):
+    # CHUNKS_PER_WORKER chunks for every worker...
+    by_balance = -(-item_count // (workers * CHUNKS_PER_WORKER))
+    # ...unless that makes them too short to hide the dispatch overhead, in
+    # which case the overhead wins and there are fewer, longer chunks
+    by_overhead = int(MIN_CHUNK_SECONDS / max(seconds_per_item, 1e-9)) + 1
+    return max(1, min(item_count, max(by_overhead, by_balance)))
+
+
+def parallel_reduce(func, items, reducer, processes=None, chunk_size=None,
+                    start_method=None):
+    # Computes reducer(...reducer(func(chunk1), func(chunk2))...,
+    # func(chunkN))
+    # where the chunks are consecutive slices of 'items' (typically a range)
+    # and func() runs in worker Processes. 'func' must be a module-level
+    # function so that it can be sent to the workers. The partial results are
+    # combined in the order of the chunks, so 'reducer' only has to be
+    # associative. Gives the same result as func(items) for any func and
+    # reducer for which splitting the items does not change the result.
+    items_count = len(items)
+    if items_count == 0:
+        return func(items)
+    processes = processes or os.cpu_count() or 1
+
+    results = []
+    if chunk_size is None:
+        done, results, seconds_per_item = _calibrate(func, items)
+        chunk_size = choose_chunk_size(items_count - done, seconds_per_item,
+                                       processes)
+    else:
+        done = 0
+    chunks = [items[i:i + chunk_size]
+              for i in range(done, items_count, chunk_size)]
+
+    if chunks:
+        context = multiprocessing.get_context(start_method)
+        pool = context.Pool(min(processes, len(chunks)))
+        try:
+            # imap() returns the results in the order of the chunks, while
+            # the workers compute them in any order
+            results.extend(pool.imap(func, chunks))
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            # wait for the worker Processes to exit instead of leaving them
+            # behind
+            pool.join()
+
+    total = results[0]
+    for result in results[1:]:
+        total = reducer(total, result)
+    return total
+
+
+# The loop of creating_processes.do_work() and creating_threads.do_work2(),
+# counting the iterations of one chunk of the range
+def count_iterations(chunk):
+    i = 0
+    for _ in chunk:
+        i += 1
+    return i
+
+
+def main():
+    work = range(20000000)
+    start = time.perf_counter()
+    serial = count_iterations(work)
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = parallel_reduce(count_iterations, work, operator.add)
+    parallel_time = time.perf_counter() - start
+
+    print(f'Serial:   {serial} in {serial_time:.2f} s')
+    speedup = serial_time / parallel_time
+    print(f'Parallel: {parallel} in {parallel_time:.2f} s on '
+          f'{os.cpu_count()} cores, speedup {speedup:.2f}')
+    print('Results match:', serial == parallel)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+# A BOUNDED MULTI-STAGE PIPELINE
+
+# The letter counting job of inter_thread_communication.py is really a chain
+# of steps: fetch a document, decode it, count its letters and merge the
+# counts into the frequency table. Running every step of a document on one
+# thread means the number of threads fetching is the number of threads
+# counting. Here every step is a stage with its own number of worker
+# threads, and consecutive stages are connected by a BoundedQueue:
+#
+#   pipeline = Pipeline([Stage('fetch', fetch, workers=20),
+#                        Stage('count', count_bytes, workers=2),
+#                        Stage('merge', merge, workers=1)])
+#   pipeline.run(urls)
+#   print(pipeline.report())
+#
+# A BoundedQueue is the conditional variable pattern of
+# synchronization_using_conditional_vars.py twice over: a consumer waits on
+# 'not_empty' while the queue is empty, just like spendy waits while the
+# money is below 20, and a producer waits on 'not_full' while the queue holds
+# 'capacity' items. That second wait is the backpressure: when a stage is
+# slow, its input queue fills up and the workers of the stage before it
+# block on put() until it catches up, and so on back to the source. The
+# items of the source are only taken as the first queue has room for them,
+# so however many there are, at most the capacities of the queues plus one
+# item per worker are in flight and the memory used stays bounded.
+
+# Whatever a stage function returns is put on the queue of the next stage,
+# except None, which drops the item. What the last stage returns is
+# discarded, so the last stage usually stores its results somewhere, like
+# the merge stage that adds up the frequency tables. An exception raised by a
+# stage function drops the item and is recorded in 'errors', the pipeline
+# keeps running. The record holds the key of the item, given by the 'key'
+# function of the stage, or else a short repr of it, and the exception
+# without its traceback, never the item itself: an item can be a whole
+# document, and keeping the failed ones would make the memory grow with
+# the number of failures.
+
+import reprlib
+import time
+from collections import deque
+from threading import Thread, Lock, Condition
+
+DEFAULT_CAPACITY = 16
+# errors kept in Pipeline.errors, the rest are only counted
+MAX_ERRORS = 100
+
+
+class _ItemRepr(reprlib.Repr):
+    # like reprlib.repr(), but only gives the length of bytes, which it would
+    # otherwise repr in full before cutting them short
+
+    def __init__(self):
+        super().__init__()
+        self.maxstring = 100
+        self.maxother = 100
+
+    def repr_bytes(self, obj, level):
+        return f'<{len(obj)} bytes>'
+
+    repr_bytearray = repr_bytes
+    repr_memoryview = repr_bytes
+
+
+_item_repr = _ItemRepr().repr
+
+
+class Closed(Exception):
+    pass
+
+
+class BoundedQueue:
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._items = deque()
+        self._closed = False
+        mutex = Lock()
+        self.not_empty = Condition(mutex)
+        self.not_full = Condition(mutex)
+        # statistics, updated under the mutex
+        self.max_depth = 0
+        self._depth_sum = 0
+        self._puts = 0
+
+    def put(self, item):
+        # Returns the seconds spent waiting for room in the queue
+        blocked = 0.0
+        with self.not_full:
+            if len(self._items) >= self.capacity:
+                start = time.perf_counter()
+                while len(self._items) >= self.capacity:
+                    self.not_full.wait()
+                blocked = time.perf_counter() - start
+            self._items.append(item)
+            depth = len(self._items)
+            self._depth_sum += depth
+            self._puts += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self.not_empty.notify()
+        return blocked
+
+    def get(self):
+        # Returns the next item and the seconds spent waiting for it. Raises
+        # Closed once the queue is closed and empty.
+        blocked = 0.0
+        with self.not_empty:
+            if not self._items:
+                start = time.perf_counter()
+                while not self._items and not self._closed:
+                    self.not_empty.wait()
+                blocked = time.perf_counter() - start
+            if not self._items:
+                raise Closed
+            item = self._items.popleft()
+            self.not_full.notify()
+        return item, blocked
+
+    def close(self):
+        # No more items will be put, wakes up every waiting consumer
+        with self.not_empty:
+            self._closed = True
+            self.not_empty.notify_all()
+
+    @property
+    def mean_depth(self):
+        return self._depth_sum / self._puts if self._puts else 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StageStats:
+
+    def __init__(self):
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        # waiting for input (the stage before is too slow)
+        self.blocked_get = 0.0
+        # waiting for room downstream (the stage after is too slow)
+        self.blocked_put = 0.0
+
+
+class Stage:
+
+    def __init__(self, name, func, workers=1, capacity=DEFAULT_CAPACITY,
+                 key=None):
+        # 'capacity' is the size of the input queue of the stage, key(item)
+        # identifies a failed item in Pipeline.errors
+        self.name = name
+        self.func = func
+        self.key = key or _item_repr
+        self.workers = workers
+        self.capacity = capacity
+        self.input = None
+        self.output = None
+        self.stats = StageStats()
+        self._mutex = Lock()
+        self._running = 0
+
+
+class Pipeline:
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        for stage in self.stages:
+            stage.input = BoundedQueue(stage.capacity)
+        for stage, following in zip(self.stages, self.stages[1:]):
+            stage.output = following.input
+        self.errors = []
+        self.error_count = 0
+        self._errors_mutex = Lock()
+        self.seconds = 0.0
+        self.source_blocked = 0.0
+
+    def _work(self, stage):
+        stats = StageStats()
+        func = stage.func
+        output = stage.output
+        try:
+            while True:
+                try:
+                    item, blocked = stage.input.get()
+                except Closed:
+                    break
+                stats.blocked_get += blocked
+                start = time.perf_counter()
+                try:
+                    result = func(item)
+                except Exception as e:
+                    stats.errors += 1
+                    self._record_error(stage, item, e)
+                    result = None
+                stats.busy += time.perf_counter() - start
+                stats.processed += 1
+                if result is not None and output is not None:
+                    stats.blocked_put += output.put(result)
+        finally:
+            # the statistics of the worker are added once, when it is done
+            with stage._mutex:
+                total = stage.stats
+                total.processed += stats.processed
+                total.errors += stats.errors
+                total.busy += stats.busy
+                total.blocked_get += stats.blocked_get
+                total.blocked_put += stats.blocked_put
+                stage._running -= 1
+                last = stage._running == 0
+            # the last worker of a stage to finish tells the next stage that
+            # nothing more is coming
+            if last and output is not None:
+                output.close()
+
+    def _record_error(self, stage, item, error):
+        with self._errors_mutex:
+            self.error_count += 1
+            if len(self.errors) < MAX_ERRORS:
+                # the frames of the traceback still refer to the item
+                error.__traceback__ = None
+                self.errors.append((stage.name, stage.key(item), error))
+
+    def run(self, items):
+        # Feeds every item of the iterable 'items' through the stages and
+        # returns once the last stage is done with all of them. The items
+        # are taken one at a time as the first queue has room for them.
+        start = time.perf_counter()
+        threads = []
+        for stage in self.stages:
+            stage._running = stage.workers
+            for _ in range(stage.workers):
+                t = Thread(target=self._work, args=(stage,), daemon=True)
+                t.start()
+                threads.append(t)
+        first = self.stages[0].input
+        try:
+            for item in items:
+                self.source_blocked += first.put(item)
+        finally:
+            first.close()
+            for t in threads:
+                t.join()
+            self.seconds = time.perf_counter() - start
+
+    def report(self):
+        # One dict per stage: items processed per second of the whole run,
+        # the mean and maximum depth of its input queue, and the seconds its
+        # workers spent working, waiting for input and waiting for room in
+        # the next queue, all workers added together.
+        stages = []
+        for stage in self.stages:
+            stats = stage.stats
+            stages.append({
+                'stage': stage.name,
+                'workers': stage.workers,
+                'processed': stats.processed,
+                'errors': stats.errors,
+                'per_second': (stats.processed / self.seconds
+                               if self.seconds else 0.0),
+                'mean_depth': stage.input.mean_depth,
+                'max_depth': stage.input.max_depth,
+                'capacity': stage.capacity,
+                'busy': stats.busy,
+                'blocked_get': stats.blocked_get,
+                'blocked_put': stats.blocked_put,
+            })
+        return stages
+
+
+def format_report(report):
+    lines = [f'{"stage":>8} {"workers":>8} {"items":>7} {"items/s":>9} '
+             f'{"depth":>11} {"busy s":>8} {"starved s":>10} '
+             f'{"blocked s":>10} {"errors":>7}']
+    for s in report:
+        depth = f'{s["mean_depth"]:.1f}/{s["max_depth"]}/{s["capacity"]}'
+        lines.append(f'{s["stage"]:>8} {s["workers"]:>8} {s["processed"]:>7} '
+                     f'{s["per_second"]:>9.1f} {depth:>11} {s["busy"]:>8.2f} '
+                     f'{s["blocked_get"]:>10.2f} {s["blocked_put"]:>10.2f} '
+                     f'{s["errors"]:>7}')
+    return '\n'.join(lines)
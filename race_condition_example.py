@@ -11,6 +11,8 @@
 import time
 from threading import Thread, Lock
 
+from sharded_counter import ShardedCounter
+
 
 class StingySpendy:
     money = 100  # class variable
@@ -58,26 +60,65 @@ class StingySpendySynchronized:
         print('Spendy Done')
 
 
-ss = StingySpendy()
-Thread(target=ss.stingy(), args=()).start()
-Thread(target=ss.spendy(), args=()).start()
-time.sleep(5)
-# If we add 10 million times and subtract 10 million times, the result
-# should be the original value. But we see a weird result here because
-# of race condition.
-# To prevent the race condition, we have to lock the access to a particular
-# chunk of code so that only one thread can access it at any point of time.
-# This is achieved by using a "mutex lock".
-# In our example, stingy will ask for mutex locking the access to the
-# self.money variable and if it is not already locked, it will be locked
-# with the stingy thread. Once stringy is done modifying the variable,
-# the mutex lock will be unlocked for the spendy thread to use and vice versa.
-# One of the guarantees of mutexes is that if two operations request for
-# locking of a resource at the same time, only one of the operations will
-# be locked with the resource.
-
-# REMEMBER:
-# Optimize the parallel program to lock the resource for minimal amount
-# of time and to call the .acquire() and .release() methods of the mutex
-# lock minimally
-print("Money in the end", ss.money)
+# Locking the mutex for every single update makes the Threads spend their
+# time handing the mutex to each other. With a sharded counter, every Thread
+# adds to its own private shard without any lock and only moves its shard
+# into the shared total once every 'flush_every' updates (see
+# sharded_counter.py). The total is still exact: stingy and spendy below
+# always leave exactly 100 in the end.
+class StingySpendySharded:
+    money = ShardedCounter(100)  # class variable
+
+    def stingy(self, iterations=10000000):
+        for i in range(iterations):
+            self.money.add(10)
+        # checkpoint: move what is left in this thread's shard to the total
+        self.money.flush()
+        print('Stingy Done')
+
+    def spendy(self, iterations=10000000):
+        for i in range(iterations):
+            self.money.add(-10)
+        self.money.flush()
+        print('Spendy Done')
+
+
+def main():
+    ss = StingySpendy()
+    Thread(target=ss.stingy, args=()).start()
+    Thread(target=ss.spendy, args=()).start()
+    time.sleep(5)
+    # If we add 10 million times and subtract 10 million times, the result
+    # should be the original value. But we see a weird result here because
+    # of race condition.
+    # To prevent the race condition, we have to lock the access to a
+    # particular chunk of code so that only one thread can access it at any
+    # point of time. This is achieved by using a "mutex lock".
+    # In our example, stingy will ask for mutex locking the access to the
+    # self.money variable and if it is not already locked, it will be locked
+    # with the stingy thread. Once stringy is done modifying the variable,
+    # the mutex lock will be unlocked for the spendy thread to use and vice
+    # versa.
+    # One of the guarantees of mutexes is that if two operations request for
+    # locking of a resource at the same time, only one of the operations will
+    # be locked with the resource.
+
+    # REMEMBER:
+    # Optimize the parallel program to lock the resource for minimal amount
+    # of time and to call the .acquire() and .release() methods of the mutex
+    # lock minimally
+    print("Money in the end", ss.money)
+
+    # To run the balanced sharded version, where the result is always 100:
+    # ssh = StingySpendySharded()
+    # threads = [Thread(target=ssh.stingy, args=()),
+    #            Thread(target=ssh.spendy, args=())]
+    # for t in threads:
+    #     t.start()
+    # for t in threads:
+    #     t.join()
+    # print("Money in the end", ssh.money.value())
+
+
+if __name__ == '__main__':
+    main()
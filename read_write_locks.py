@@ -0,0 +1,184 @@
+# READER-WRITER LOCKS AND SEQUENCE LOCKS
+
+# The balance in synchronization_using_conditional_vars.py is read far more
+# often than it is updated. With a single Lock or Condition every reader
+# excludes every other reader, although readers never change anything and
+# could all look at the balance at the same time.
+
+# A ReadWriteLock lets any number of readers hold it at the same time, or a
+# single writer alone. Its 'reader' and 'writer' sides are used with the
+# 'with' statement:
+#
+#   rw = ReadWriteLock()
+#   with rw.reader:
+#       print(account.money)
+#   with rw.writer:
+#       account.money += 10
+#
+# With the default reader preference, a reader gets in whenever no writer
+# is active, so a steady stream of readers can keep a writer waiting
+# forever. With prefer_writers=True, new readers wait as soon as a writer is
+# waiting, so writers cannot be starved, but a steady stream of writers can
+# starve the readers instead.
+
+# A SeqLock goes further: readers take no lock at all. Every writer
+# increments a sequence number before and after its update, so the sequence
+# number is odd while an update is in progress. A reader remembers the
+# sequence number, reads optimistically, and retries if the number was odd or
+# has changed since, because then a writer may have changed the data under
+# it. Reads never slow down writers, but a reader may have to retry while
+# writes are frequent, and the read function must be safe to run on data in
+# the middle of an update (it may see some fields updated and others not,
+# and the result is then thrown away).
+#
+#   seq = SeqLock()
+#   with seq:
+#       account.money += 10
+#   money = seq.read(lambda: account.money)
+
+import time
+from threading import Lock, Condition
+
+
+class _Side:
+    # one side of a ReadWriteLock, usable with the 'with' statement
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+
+class ReadWriteLock:
+
+    def __init__(self, prefer_writers=False):
+        self.prefer_writers = prefer_writers
+        # the fast paths below take the mutex directly, Condition.__enter__
+        # is a Python level call that would double the cost of a read
+        self._mutex = Lock()
+        self._cond = Condition(self._mutex)
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        # threads sleeping on _cond, there is no one to notify when it is 0
+        self._sleepers = 0
+        self.reader = _Side(self.acquire_read, self.release_read)
+        self.writer = _Side(self.acquire_write, self.release_write)
+
+    def _wait_until(self, predicate):
+        # called with _mutex held
+        if predicate():
+            return
+        self._sleepers += 1
+        try:
+            self._cond.wait_for(predicate)
+        finally:
+            self._sleepers -= 1
+
+    def _wake(self):
+        # called with _mutex held
+        if self._sleepers:
+            self._cond.notify_all()
+
+    def _can_read(self):
+        if self.prefer_writers:
+            return not self._writer and not self._waiting_writers
+        return not self._writer
+
+    def _can_write(self):
+        return not self._writer and not self._readers
+
+    def acquire_read(self):
+        with self._mutex:
+            if self._writer or (self.prefer_writers
+                                and self._waiting_writers):
+                self._wait_until(self._can_read)
+            self._readers += 1
+
+    def release_read(self):
+        with self._mutex:
+            self._readers -= 1
+            if not self._readers and self._sleepers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._mutex:
+            self._waiting_writers += 1
+            try:
+                self._wait_until(self._can_write)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._mutex:
+            self._writer = False
+            self._wake()
+
+    def wait_for(self, predicate):
+        # Like Condition.wait_for(), for a thread that holds the write side:
+        # gives up the write side until predicate() is true, and returns
+        # holding it again. predicate() is checked every time a writer
+        # releases the lock. The waiting thread is not counted as a waiting
+        # writer, so it does not hold back the readers in the meantime.
+        with self._mutex:
+            if predicate():
+                return
+            self._writer = False
+            self._wake()
+            self._wait_until(lambda: self._can_write() and predicate())
+            self._writer = True
+
+
+class SeqLock:
+
+    def __init__(self):
+        self._sequence = 0
+        self._mutex = Lock()
+        # reads that had to be retried, not exact when readers race
+        self.retries = 0
+
+    # Writers that are already serialized by a lock of their own, such as
+    # the Condition of a StingySpendy class, only mark the update with
+    # write_begin() and write_end(). Others use the SeqLock with the 'with'
+    # statement, which also takes its mutex.
+
+    def write_begin(self):
+        self._sequence += 1
+
+    def write_end(self):
+        self._sequence += 1
+
+    def __enter__(self):
+        self._mutex.acquire()
+        self._sequence += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._sequence += 1
+        self._mutex.release()
+        return False
+
+    def read(self, reader):
+        # Returns reader(), as run while no writer changed the data
+        while True:
+            start = self._sequence
+            if start & 1:
+                # a writer is in the middle of an update, let it finish
+                time.sleep(0)
+                continue
+            result = reader()
+            if self._sequence == start:
+                return result
+            self.retries += 1
+
+    @property
+    def sequence(self):
+        return self._sequence
@@ -0,0 +1,411 @@
+# A SAMPLING PROFILER FOR THREADS AND THE GIL
+
+# creating_threads.py runs do_work2() on 5 Threads and explains that, because
+# of the GIL, only one of them runs at a time. The SamplingProfiler shows how
+# their time is actually spent. A background thread wakes up every
+# 'interval' seconds and, for every other Thread of the process, records:
+#
+# - its Python stack, as a key into a table of stack counts, which is
+#   exported in the "collapsed" format read by flamegraph.pl, speedscope and
+#   most other flame graph tools (one "thread;outer;...;inner count" line
+#   per stack),
+# - its CPU time, from the CPU clock of that Thread (the clock that
+#   time.thread_time() reads for the calling Thread), to compare with the
+#   wall clock time that passed since the last sample.
+#
+# The wall clock time of every Thread is split into three parts:
+#
+# - running: the CPU time it used,
+# - blocked: off the CPU while inside a call to a C function, such as
+#   time.sleep(), a socket read or Lock.acquire(), which release the GIL
+#   while they wait,
+# - GIL wait: off the CPU in the middle of Python code, where it can only
+#   have stopped because it had to hand the GIL to another Thread. This
+#   part is counted only while the other Threads did use the CPU, since
+#   one of them then held the GIL.
+#
+# This is an estimate: it looks at one instant per interval, and the
+# Thread waiting to get the GIL back right after a blocking call returns is
+# counted as blocked. CPU clocks of other Threads are only available on Unix,
+# elsewhere every Thread shows as running.
+#
+#   with SamplingProfiler() as profiler:
+#       run_the_threads()
+#   print(format_report(profiler.report()))
+#   profiler.write_collapsed('threads.folded')
+#
+# sweep_switch_interval() runs a workload under the profiler once for every
+# value of sys.setswitchinterval(), which sets how long a Thread may keep the
+# GIL while others are waiting for it (5 ms by default). Shorter intervals
+# let waiting Threads in sooner, at the cost of more switches.
+
+# The profiler never stops the Threads it looks at. Its cost is the CPU time
+# of the sampler, which takes tens of microseconds per sample with a handful
+# of Threads (about 1% of one core at the default 10 ms interval), plus one
+# extra GIL handover per sample. Under the GIL the sampler itself has to
+# wait for the GIL, so with busy Threads the samples are up to one switch
+# interval late, and fewer than one per 'interval'. Run
+# 'python sampling_profiler.py --overhead' to measure the overhead on a
+# workload.
+
+# With long switch intervals that gets much worse: at 20 or 100 ms the
+# sampler may only get the GIL a handful of times during the whole run, and
+# a Thread that was seen once or twice has next to no wall clock time to
+# split. The report therefore shows the number of samples of every Thread
+# and marks the Threads with fewer than MIN_SAMPLES of them, whose shares
+# should not be trusted.
+
+import argparse
+import contextlib
+import dis
+import functools
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from threading import Thread, Event, get_ident
+
+DEFAULT_INTERVAL = 0.01
+# Threads sampled fewer times than this are marked in the report
+MIN_SAMPLES = 10
+SWITCH_INTERVALS = [0.0005, 0.001, 0.005, 0.02, 0.1]
+
+_CALL_OPCODES = {dis.opmap[name] for name in
+                 ('CALL', 'PRECALL', 'CALL_FUNCTION', 'CALL_FUNCTION_KW',
+                  'CALL_FUNCTION_EX', 'CALL_METHOD', 'CALL_KW')
+                 if name in dis.opmap}
+
+
+def _thread_clock(ident):
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+def _in_call(frame):
+    # True when the frame is stopped on a call, which, since the top frame
+    # is not a Python function, is a call to a C function
+    code = frame.f_code.co_code
+    offset = frame.f_lasti
+    return 0 <= offset < len(code) and code[offset] in _CALL_OPCODES
+
+
+def _frame_name(code):
+    return (f'{os.path.basename(code.co_filename)}:'
+            f'{getattr(code, "co_qualname", code.co_name)}')
+
+
+class ThreadStats:
+
+    def __init__(self, ident, name, clock):
+        self.ident = ident
+        self.name = name
+        self.clock = clock
+        self.cpu = None
+        self.wall = 0.0
+        self.running = 0.0
+        self.gil_wait = 0.0
+        self.blocked = 0.0
+        self.samples = 0
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        # ThreadStats of every Thread seen, in the order they were seen
+        self.threads = []
+        # ident -> (Thread object or None, ThreadStats). The C library
+        # reuses the ident of a Thread that ended for the next one, so the
+        # Thread object tells whether an ident still belongs to the same
+        # Thread.
+        self._by_ident = {}
+        # (thread name, tuple of code objects from outermost to innermost)
+        self.stacks = Counter()
+        self.samples = 0
+        # CPU time used by the sampler thread itself
+        self.overhead = 0.0
+        self.seconds = 0.0
+        self._stop = Event()
+        self._sampler = None
+
+    def start(self):
+        self._stop.clear()
+        self._sampler = Thread(target=self._run, name='SamplingProfiler',
+                               daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def _new_thread(self, ident, thread):
+        name = thread.name if thread is not None else str(ident)
+        stats = ThreadStats(ident, name, _thread_clock(ident))
+        self.threads.append(stats)
+        self._by_ident[ident] = (thread, stats)
+        return stats
+
+    def _stats(self, ident, thread):
+        # 'thread' is None for a Thread not listed by threading.enumerate(),
+        # because it was started just now or not by the threading module
+        known = self._by_ident.get(ident)
+        if known is None:
+            return self._new_thread(ident, thread)
+        owner, stats = known
+        if owner is thread or thread is None:
+            return stats
+        if owner is None:
+            # first seen before threading.enumerate() listed it
+            stats.name = thread.name
+            self._by_ident[ident] = (thread, stats)
+            return stats
+        # the ident was reused by a new Thread, which gets its own
+        # statistics and CPU clock
+        return self._new_thread(ident, thread)
+
+    def _run(self):
+        me = get_ident()
+        start = last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed = now - last
+            last = now
+            self._sample(me, elapsed)
+        self.seconds = time.perf_counter() - start
+        self.overhead = time.thread_time()
+
+    def _sample(self, me, elapsed):
+        self.samples += 1
+        # listed before the frames are taken, so that a Thread that ends in
+        # between is never paired with the Thread that gets its ident
+        running = {t.ident: t for t in threading.enumerate()}
+        frames = sys._current_frames()
+        current = []
+        busy = 0.0
+        for ident, frame in frames.items():
+            if ident == me:
+                continue
+            stats = self._stats(ident, running.get(ident))
+            stack = []
+            f = frame
+            while f is not None:
+                stack.append(f.f_code)
+                f = f.f_back
+            stack.reverse()
+            self.stacks[(stats.name, tuple(stack))] += 1
+            stats.samples += 1
+
+            cpu = None
+            if stats.clock is not None:
+                try:
+                    cpu = time.clock_gettime(stats.clock)
+                except OSError:
+                    # the Thread ended since the frames were taken
+                    pass
+            if cpu is None or stats.cpu is None:
+                # nothing to compare with yet, the first interval is skipped
+                stats.cpu = cpu
+                if stats.clock is None:
+                    stats.wall += elapsed
+                    stats.running += elapsed
+                continue
+            used = min(max(cpu - stats.cpu, 0.0), elapsed)
+            stats.cpu = cpu
+            busy += used
+            current.append((stats, frame, used))
+
+        for stats, frame, used in current:
+            stats.wall += elapsed
+            stats.running += used
+            off_cpu = elapsed - used
+            gil_wait = 0.0
+            if not _in_call(frame):
+                gil_wait = min(off_cpu, busy - used)
+            stats.gil_wait += gil_wait
+            stats.blocked += off_cpu - gil_wait
+
+    def report(self):
+        # One dict per Thread seen, with the seconds of wall clock time it was
+        # sampled for, split into running, GIL wait and blocked
+        return [{'thread': stats.name,
+                 'samples': stats.samples,
+                 'wall': stats.wall,
+                 'running': stats.running,
+                 'gil_wait': stats.gil_wait,
+                 'blocked': stats.blocked}
+                for stats in self.threads]
+
+    def collapsed(self):
+        # The stacks in the collapsed flame graph format
+        lines = []
+        for (name, stack), count in sorted(self.stacks.items(),
+                                           key=lambda item: -item[1]):
+            frames = ';'.join([name.replace(' ', '_')] +
+                              [_frame_name(code) for code in stack])
+            lines.append(f'{frames} {count}')
+        return lines
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
+
+
+def format_report(report):
+    lines = [f'{"thread":>20} {"samples":>8} {"wall s":>8} {"running":>8} '
+             f'{"GIL wait":>9} {"blocked":>8}']
+    too_few = False
+    for t in report:
+        wall = t['wall'] or 1.0
+        mark = ''
+        if t['samples'] < MIN_SAMPLES:
+            mark = ' *'
+            too_few = True
+        lines.append(f'{t["thread"][:20]:>20} {t["samples"]:>8} '
+                     f'{t["wall"]:>8.2f} '
+                     f'{t["running"] / wall:>8.0%} '
+                     f'{t["gil_wait"] / wall:>9.0%} '
+                     f'{t["blocked"] / wall:>8.0%}{mark}')
+    if too_few:
+        lines.append(f'* fewer than {MIN_SAMPLES} samples, not enough to '
+                     f'split its time: run a longer workload')
+    return '\n'.join(lines)
+
+
+def sweep_switch_interval(workload, intervals=SWITCH_INTERVALS,
+                          sample_interval=DEFAULT_INTERVAL):
+    # Runs workload() under the profiler for every switch interval. Returns
+    # a list of (switch interval, wall clock seconds, profiler).
+    original = sys.getswitchinterval()
+    results = []
+    try:
+        for switch_interval in intervals:
+            sys.setswitchinterval(switch_interval)
+            profiler = SamplingProfiler(sample_interval)
+            start = time.perf_counter()
+            with profiler:
+                workload()
+            results.append((switch_interval, time.perf_counter() - start,
+                            profiler))
+    finally:
+        sys.setswitchinterval(original)
+    return results
+
+
+# Workloads from creating_threads.py. Their prints are silenced so that they
+# do not flood the report.
+
+def cpu_workload(threads=5, iterations=2000000):
+    # do_work2() on several Threads, as in creating_threads.main()
+    from creating_threads import do_work2
+    workers = [Thread(target=do_work2, args=(iterations,),
+                      name=f'do_work2-{i}')
+               for i in range(threads)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+
+def mixed_workload(threads=4, iterations=2000000, sleeps=50):
+    # do_work2() on several Threads, next to one Thread that repeatedly
+    # sleeps for 1 ms, like a Thread handling short I/O requests: every time
+    # it wakes up it has to wait for the GIL before it can run again
+    from creating_threads import do_work, do_work2
+
+    def io_thread():
+        for _ in range(sleeps):
+            do_work(0.001)
+
+    workers = [Thread(target=do_work2, args=(iterations,),
+                      name=f'do_work2-{i}')
+               for i in range(threads)]
+    workers.append(Thread(target=io_thread, name='do_work'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+
+WORKLOADS = {'cpu': cpu_workload, 'mixed': mixed_workload}
+
+
+def measure_overhead(workload, interval, repeats=5):
+    # Returns the median wall clock time of the workload without and with
+    # the profiler, and the share of the CPU time taken by the sampler
+    # itself. Runs with and without alternate, so that both see the same
+    # background load.
+    plain = []
+    profiled = []
+    sampler = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        workload()
+        plain.append(time.perf_counter() - start)
+        profiler = SamplingProfiler(interval)
+        start = time.perf_counter()
+        with profiler:
+            workload()
+        profiled.append(time.perf_counter() - start)
+        sampler.append(profiler.overhead / profiler.seconds)
+    return (statistics.median(plain), statistics.median(profiled),
+            statistics.median(sampler))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workload', choices=sorted(WORKLOADS),
+                        default='cpu')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL)
+    parser.add_argument('--sweep', action='store_true',
+                        help='run once for every sys.setswitchinterval()')
+    parser.add_argument('--collapsed', metavar='PATH',
+                        help='write the stacks for a flame graph to PATH')
+    parser.add_argument('--overhead', action='store_true')
+    args = parser.parse_args()
+    workload = WORKLOADS[args.workload]
+
+    if args.overhead:
+        # a longer run than the default, for a steadier measurement
+        plain, profiled, sampler = measure_overhead(
+            functools.partial(workload, iterations=10000000), args.interval)
+        print(f'without profiler {plain:.3f} s, with profiler '
+              f'{profiled:.3f} s, overhead {profiled / plain - 1:.1%}, '
+              f'sampler CPU {sampler:.1%}')
+        return
+
+    if args.sweep:
+        for switch_interval, wall, profiler in sweep_switch_interval(
+                workload, sample_interval=args.interval):
+            print(f'switch interval {switch_interval * 1000:g} ms: '
+                  f'{wall:.2f} s, {profiler.samples} samples')
+            print(format_report(profiler.report()))
+        return
+
+    profiler = SamplingProfiler(args.interval)
+    with profiler:
+        workload()
+    print(format_report(profiler.report()))
+    print(f'{profiler.samples} samples, sampler CPU time '
+          f'{profiler.overhead:.3f} s of {profiler.seconds:.2f} s')
+    if args.collapsed:
+        profiler.write_collapsed(args.collapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# A COUNTER WITH ONE SHARD PER THREAD
+
+# StingySpendySynchronized in race_condition_example.py acquires and releases
+# its mutex for every single 'money += 10', so the Threads spend almost all
+# of their time handing the mutex to each other, and the synchronized
+# version ends up far slower than the one with the race condition.
+
+# Here every Thread adds to its own private delta (its shard) instead of the
+# shared total. No other Thread ever writes to that delta, so no lock is
+# needed to update it. Once 'flush_every' updates have piled up in a shard,
+# or when the Thread asks for it with flush() (a checkpoint), the delta is
+# moved into the shared total under the mutex. The mutex is then taken once
+# per 'flush_every' updates instead of once per update, so writers almost
+# never contend for it.
+
+# A reader that wants the exact total takes the mutex and adds up the shared
+# total and the deltas of all the shards. Moving a delta into the total is
+# done under the same mutex, so no delta is ever counted twice or missed.
+# The owner of a shard may be updating its delta while we read it, but we
+# then see either the value before or the value after that update, both of
+# which were the exact state of that shard at some instant.
+
+# When a Thread ends, its thread-local data goes away with it. A small
+# object kept only there has a weakref finalizer that moves the delta of the
+# shard into the shared total and forgets the shard, so a long-lived counter
+# updated by many short-lived Threads only keeps the shards of the Threads
+# that are still running, and value() does not slow down over time.
+
+# Do not expect much from this under the GIL. Only one Thread runs Python
+# code at a time, and the mutex is mostly handed over at switch intervals, so
+# the cost of an update is dominated by the interpreter, not by contention.
+# benchmark_sharded_counter.py measured anything from no gain at all (0.9 to
+# 1.1 times the updates per second of the mutex) to about 2 times, depending
+# on the machine and the number of Threads. The gain is only expected to be
+# large on a free-threaded build, where the Threads really do run at once.
+
+import threading
+import weakref
+from threading import Lock
+
+DEFAULT_FLUSH_EVERY = 1024
+
+
+class _Shard:
+    __slots__ = ('delta', 'pending')
+
+    def __init__(self):
+        self.delta = 0
+        self.pending = 0
+
+
+class _ShardOwner:
+    # only referenced from the thread-local data of one Thread, so it is
+    # freed when that Thread ends
+    __slots__ = ('__weakref__',)
+
+
+def _retire_shard(counter_ref, shard):
+    counter = counter_ref()
+    if counter is None:
+        return
+    with counter._mutex:
+        counter._total += shard.delta
+        shard.delta = 0
+        counter._shards.discard(shard)
+
+
+class ShardedCounter:
+
+    def __init__(self, initial=0, flush_every=DEFAULT_FLUSH_EVERY):
+        self.flush_every = flush_every
+        self._total = initial
+        self._mutex = Lock()
+        self._local = threading.local()
+        # the shards of the Threads that are still running
+        self._shards = set()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = _Shard()
+        owner = _ShardOwner()
+        with self._mutex:
+            self._shards.add(shard)
+        self._local.shard = shard
+        self._local.owner = owner
+        # a weak reference to the counter, the finalizer must not keep it
+        # alive for as long as the Thread runs
+        weakref.finalize(owner, _retire_shard, weakref.ref(self), shard)
+        return shard
+
+    def add(self, amount):
+        # the common case is inlined, add() is called for every update
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        shard.delta += amount
+        shard.pending += 1
+        if shard.pending >= self.flush_every:
+            self._flush(shard)
+
+    def _flush(self, shard):
+        with self._mutex:
+            self._total += shard.delta
+            shard.delta = 0
+        shard.pending = 0
+
+    def flush(self):
+        # checkpoint: moves the pending delta of the calling Thread into the
+        # shared total
+        self._flush(self._shard())
+
+    def value(self):
+        # the exact total, including the deltas not flushed yet
+        with self._mutex:
+            return self._total + sum(shard.delta for shard in self._shards)
+
+    def flushed_value(self):
+        # the shared total only, without taking the mutex; it lags behind by
+        # at most flush_every updates per Thread
+        return self._total
@@ -0,0 +1,171 @@
+# A LEDGER OF ACCOUNTS SHARED BY PROCESSES
+
+# All the StingySpendy classes in race_condition_example.py keep 'money' in a
+# Python variable, so stingy and spendy can only run on Threads of the same
+# Process, and the GIL lets only one of them run at a time. Here the balances
+# of the accounts live in a block of shared memory (a SharedBuffer from
+# warm_pool.py) that every Process maps into its own memory, so stingy and
+# spendy can run in separate Processes on separate cores.
+
+# 'money += 10' on shared memory is still a read followed by a write, and two
+# Processes can interleave them just like two Threads, so every update is
+# done under a lock. A single lock for the whole ledger would make every
+# Process wait for every other one. Instead the accounts are divided among
+# 'stripes' locks (account i is guarded by lock i % stripes), and updates of
+# accounts under different locks run at the same time. With one account
+# there is nothing to spread out and the Processes take turns, with many
+# accounts the throughput grows with the number of cores.
+
+# Every balance is given a cache line of its own. Balances of accounts that
+# are guarded by different locks but share a cache line would otherwise make
+# the cores fight over that line on every update (false sharing).
+#
+#   ledger = SharedLedger(accounts=1, initial=100)
+#   processes = [Process(target=stingy, args=(ledger, 0, 1000000)),
+#                Process(target=spendy, args=(ledger, 0, 1000000))]
+#   ...
+#   print(ledger.balance(0))  # always 100
+
+import multiprocessing
+from multiprocessing import resource_tracker
+
+from warm_pool import SharedBuffer
+
+DEFAULT_STRIPES = 64
+# 64 byte cache lines hold 8 signed 64 bit balances
+CACHE_LINE = 64
+SLOT_SIZE = 8
+SLOT_STRIDE = CACHE_LINE // SLOT_SIZE
+
+
+class SharedLedger:
+    # 'accounts' balances of signed 64 bit integers, all starting at
+    # 'initial'. A SharedLedger can be passed as an argument to a Process
+    # (its locks cannot be sent through a Queue or a Pool), and the Process
+    # that created it owns the shared memory and removes it on close().
+
+    def __init__(self, accounts=1, initial=0, stripes=DEFAULT_STRIPES,
+                 context=None, _shared=None):
+        self.accounts = accounts
+        if _shared is None:
+            context = context or multiprocessing.get_context()
+            stripes = max(1, min(stripes, accounts))
+            # start the resource tracker before any Process that attaches to
+            # the ledger, so that they all share it with us
+            resource_tracker.ensure_running()
+            self.buffer = SharedBuffer(accounts * CACHE_LINE)
+            self.locks = [context.Lock() for _ in range(stripes)]
+        else:
+            self.buffer, self.locks = _shared
+        self.stripes = len(self.locks)
+        self.slots = self.buffer.buf.cast('q')
+        if _shared is None:
+            for account in range(accounts):
+                self.slots[account * SLOT_STRIDE] = initial
+
+    def __reduce__(self):
+        return (_attach_ledger, (self.accounts, self.buffer, self.locks))
+
+    def add(self, account, amount):
+        lock = self.locks[account % self.stripes]
+        slot = account * SLOT_STRIDE
+        lock.acquire()
+        self.slots[slot] += amount
+        lock.release()
+
+    def deposit(self, account, amount):
+        self.add(account, amount)
+
+    def withdraw(self, account, amount):
+        self.add(account, -amount)
+
+    def transfer(self, source, destination, amount):
+        # Moves 'amount' from one account to another. Both locks are held so
+        # that no reader ever sees the money in neither or in both accounts.
+        # Locks are always taken in the order of their stripe, so two
+        # transfers in opposite directions cannot deadlock.
+        first = source % self.stripes
+        second = destination % self.stripes
+        if first > second:
+            first, second = second, first
+        self.locks[first].acquire()
+        if second != first:
+            self.locks[second].acquire()
+        self.slots[source * SLOT_STRIDE] -= amount
+        self.slots[destination * SLOT_STRIDE] += amount
+        if second != first:
+            self.locks[second].release()
+        self.locks[first].release()
+
+    def balance(self, account):
+        with self.locks[account % self.stripes]:
+            return self.slots[account * SLOT_STRIDE]
+
+    def balances(self):
+        # A consistent snapshot of all the balances. Every lock is held while
+        # reading, in the same order as transfer() takes them.
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            return [self.slots[account * SLOT_STRIDE]
+                    for account in range(self.accounts)]
+        finally:
+            for lock in reversed(self.locks):
+                lock.release()
+
+    def total(self):
+        return sum(self.balances())
+
+    def close(self):
+        if self.slots is None:
+            return
+        # the cast view has to be released before the block can be unmapped
+        self.slots.release()
+        self.slots = None
+        self.buffer.close()
+
+    def __del__(self):
+        if getattr(self, 'slots', None) is not None:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def _attach_ledger(accounts, buffer, locks):
+    return SharedLedger(accounts, _shared=(buffer, locks))
+
+
+# StingySpendy on Processes. These are module-level functions so that they
+# can be the target of a Process started with 'spawn' or 'forkserver'.
+
+def stingy(ledger, account, iterations):
+    for i in range(iterations):
+        ledger.add(account, 10)
+
+
+def spendy(ledger, account, iterations):
+    for i in range(iterations):
+        ledger.add(account, -10)
+
+
+def main():
+    iterations = 1000000
+    with SharedLedger(accounts=1, initial=100) as ledger:
+        processes = [multiprocessing.Process(target=stingy,
+                                             args=(ledger, 0, iterations)),
+                     multiprocessing.Process(target=spendy,
+                                             args=(ledger, 0, iterations))]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        print("Money in the end", ledger.balance(0))
+
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,9 @@
 import time
 from threading import Thread, Lock, Condition
 
+from account_balance import Balance
+from read_write_locks import ReadWriteLock, SeqLock
+
 
 # When using this mutex lock based class, you can see that the money variable
 # reaches negative numbers which is not ideal. spendy should be able to
@@ -91,11 +94,106 @@ class StingySpendyConditional:
             print("Spendy Done")
 
 
-ss = StingySpendy()
-ssvc = StingySpendyConditional()
-# Thread(target=ss.stingy, args=()).start()
-# Thread(target=ss.spendy, args=()).start()
-Thread(target=ssvc.stingy, args=()).start()
-Thread(target=ssvc.spendy, args=()).start()
-time.sleep(5)
-print("Money in the end: ", ss.money)
+# Class that uses a Balance (see account_balance.py) instead of a conditional
+# variable. spendy registers the amount it needs and stingy wakes it up only
+# once the balance covers that amount, instead of notifying it after every
+# single deposit. When spendy is not waiting, stingy signals nobody at all.
+class StingySpendyTargeted:
+    money = Balance(100)
+
+    def stingy(self):
+        for i in range(1000000):
+            self.money.deposit(10)
+        print("Stingy Done")
+
+    def spendy(self):
+        for i in range(500000):
+            # returns once 20 has been taken out of the balance for us
+            self.money.withdraw(20)
+        print("Spendy Done")
+
+
+# The balance is read far more often than it is updated. With the classes
+# above every reader has to take the same mutex as stingy and spendy, and
+# readers block each other. This class uses a ReadWriteLock (see
+# read_write_locks.py) instead: any number of balance() calls can run at the
+# same time, while stingy and spendy each take the write side alone. spendy
+# waits for sufficient balance with rw.wait_for(), which gives up the write
+# side while waiting, just like cv.wait() releases the lock.
+class StingySpendyReadWrite:
+    money = 100
+    rw = ReadWriteLock(prefer_writers=True)
+
+    def stingy(self):
+        for i in range(1000000):
+            with self.rw.writer:
+                self.money += 10
+        print("Stingy Done")
+
+    def spendy(self):
+        for i in range(500000):
+            with self.rw.writer:
+                self.rw.wait_for(lambda: self.money >= 20)
+                self.money -= 20
+        print("Spendy Done")
+
+    def balance(self):
+        with self.rw.reader:
+            return self.money
+
+
+# Same as StingySpendyConditional, but balance() takes no lock at all. stingy
+# and spendy mark their updates on a SeqLock and balance() retries whenever
+# an update happened while it was reading.
+class StingySpendySeqLock:
+    money = 100
+    cv = Condition()
+    seq = SeqLock()
+
+    def stingy(self):
+        for i in range(1000000):
+            self.cv.acquire()
+            self.seq.write_begin()
+            self.money += 10
+            self.seq.write_end()
+            self.cv.notify()
+            self.cv.release()
+        print("Stingy Done")
+
+    def spendy(self):
+        for i in range(500000):
+            self.cv.acquire()
+            while self.money < 20:
+                self.cv.wait()
+            self.seq.write_begin()
+            self.money -= 20
+            self.seq.write_end()
+            self.cv.release()
+        print("Spendy Done")
+
+    def balance(self):
+        return self.seq.read(lambda: self.money)
+
+
+def main():
+    ss = StingySpendy()
+    ssvc = StingySpendyConditional()
+    # Thread(target=ss.stingy, args=()).start()
+    # Thread(target=ss.spendy, args=()).start()
+    Thread(target=ssvc.stingy, args=()).start()
+    Thread(target=ssvc.spendy, args=()).start()
+    # sst = StingySpendyTargeted()
+    # Thread(target=sst.stingy, args=()).start()
+    # Thread(target=sst.spendy, args=()).start()
+    # To read the balance while stingy and spendy are running, without
+    # readers blocking each other:
+    # ssrw = StingySpendyReadWrite()  # or StingySpendySeqLock()
+    # Thread(target=ssrw.stingy, args=()).start()
+    # Thread(target=ssrw.spendy, args=()).start()
+    # print("Money now: ", ssrw.balance())
+    time.sleep(5)
+    print("Money in the end: ", ss.money)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,15 @@
 
 import time
 from threading import Thread, Lock
+import threading
+import queue
+import functools
 import os
 from os.path import isdir, join
 
+from executors import Executor
+from implementing_wait_groups import WaitGroup
+
 
 def child():
     print('Child Thread doing work...')
@@ -45,36 +51,203 @@ mutex = Lock()
 matches = []
 
 
-def file_search(root, file_name):
-    print('Searching in', root)
-
-    child_threads = []
-
-    # loop over subdir in the given root
-    for file in os.listdir(root):
-        full_path = join(root, file)
-        if file_name in file:
-            # Wait for matches to be unlocked from other threads
-            # and then lock matches with the current thread
-            mutex.acquire()
-            matches.append(full_path)
-            # release matches for other threads to use
-            mutex.release()
-        if isdir(full_path):
-            # Recursive call is done through a child thread
-            th = Thread(target=file_search, args=([full_path, file_name]))
-            th.start()
-            child_threads.append(th)
-            # we cannot do th.join() here because we will then be waiting for
-            # each child thread to complete before another child thread starts
-            # its search. This means that our search will not be parallel.
-    for th in child_threads:
-        # join every child thread to the parent thread. The parent thread
-        # waits on every child thread to give completed signal by sqeuentially
-        # communicating with each child thread. But the child threads are all
-        # started at the same time and execute concurrently through
-        # context-switching
-        th.join()
+def file_search_thread_per_directory(root, file_name, wait_group=None,
+                                     errors=None):
+    # The top-level call creates the wait group that is shared by every
+    # recursive call and is the only one waiting on it. A child thread that
+    # fails to start a thread of its own records the error in 'errors', and
+    # the top-level call raises it once every started thread has finished.
+    top_level = wait_group is None
+    if top_level:
+        wait_group = WaitGroup()
+        wait_group.add(1)
+        errors = []
+
+    try:
+        print('Searching in', root)
+
+        # loop over subdir in the given root
+        for file in os.listdir(root):
+            full_path = join(root, file)
+            if file_name in file:
+                # Wait for matches to be unlocked from other threads
+                # and then lock matches with the current thread
+                mutex.acquire()
+                matches.append(full_path)
+                # release matches for other threads to use
+                mutex.release()
+            if isdir(full_path):
+                # Recursive call is done through a child thread. The child is
+                # registered with the wait group before it is started so that
+                # the count can never drop to 0 while work is still pending.
+                wait_group.add(1)
+                th = Thread(target=file_search_thread_per_directory,
+                            args=([full_path, file_name, wait_group,
+                                   errors]))
+                try:
+                    th.start()
+                except RuntimeError as e:
+                    # "can't start new thread": the child never runs, so
+                    # its count is given back here or wait() would block
+                    # forever
+                    wait_group.done()
+                    errors.append(e)
+                    break
+                # we cannot do th.join() here because we will then be waiting
+                # for each child thread to complete before another child
+                # thread starts its search. This means that our search will
+                # not be parallel.
+    finally:
+        wait_group.done()
+
+    if top_level:
+        # Instead of joining every child thread sequentially, the parent
+        # thread sleeps on the wait group and is woken up exactly once, by
+        # whichever thread in the whole tree finishes last.
+        wait_group.wait()
+        if errors:
+            raise errors[0]
+
+
+# A BOUNDED WORK-QUEUE FILE SEARCH
+
+# file_search_thread_per_directory() starts a new Thread for every
+# subdirectory. On trees with hundreds of thousands of directories this
+# creates threads without limit, uses a lot of memory for the thread stacks
+# and eventually fails with "can't start new thread". Here a fixed number of
+# worker threads share a queue of directories that still have to be searched.
+# Each worker takes a directory from the queue, scans it and puts the
+# subdirectories it finds back on the queue for any worker to pick up.
+
+# Since the workers are also the producers of the queue, an empty queue does
+# not mean that the search is done: a worker may be scanning a directory that
+# still contains subdirectories. A wait group counts the directories that are
+# queued or being scanned and the search is done when that count reaches 0.
+
+DEFAULT_WORKERS = 8
+
+
+def _search_worker(directories, file_name, wait_group, stats):
+    local_matches = []
+    scanned = 0
+    while True:
+        directory = directories.get()
+        if directory is None:
+            # sentinel put on the queue once the whole tree has been searched
+            break
+        try:
+            # os.scandir() returns the type of each entry together with its
+            # name, so we do not need a separate isdir() call for every entry
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if file_name in entry.name:
+                        local_matches.append(entry.path)
+                    # symlinks are not followed to avoid searching cycles
+                    if entry.is_dir(follow_symlinks=False):
+                        wait_group.add(1)
+                        directories.put(entry.path)
+            scanned += 1
+        except OSError:
+            # unreadable or vanished directory, skip it like 'find' would
+            pass
+        finally:
+            wait_group.done()
+
+    # Publish the results of this worker once, instead of acquiring the mutex
+    # for every single match
+    mutex.acquire()
+    matches.extend(local_matches)
+    stats['directories'] += scanned
+    mutex.release()
+
+
+def file_search(root, file_name, workers=DEFAULT_WORKERS):
+    # Searches 'root' for entries whose name contains 'file_name' and appends
+    # their paths to the global 'matches' list, like the thread per directory
+    # version. Returns a dict with the number of directories searched, the
+    # directories searched per second and the number of threads running in
+    # the process once all the workers had started. The pool does not grow,
+    # so that is all the threads the search adds, but other threads may
+    # come and go; benchmark_file_search.ThreadSampler measures the peak.
+    start = time.perf_counter()
+    directories = queue.Queue()
+    wait_group = WaitGroup()
+    stats = {'directories': 0}
+
+    wait_group.add(1)
+    directories.put(root)
+    threads = []
+    for _ in range(workers):
+        t = Thread(target=_search_worker,
+                   args=(directories, file_name, wait_group, stats))
+        t.start()
+        threads.append(t)
+    running_threads = threading.active_count()
+
+    # wait until every queued directory has been searched and then stop the
+    # workers with one sentinel each
+    wait_group.wait()
+    for _ in threads:
+        directories.put(None)
+    for t in threads:
+        t.join()
+
+    elapsed = time.perf_counter() - start
+    stats['seconds'] = elapsed
+    stats['directories_per_second'] = (stats['directories'] / elapsed
+                                       if elapsed > 0 else 0.0)
+    stats['running_threads'] = running_threads
+    return stats
+
+
+# A FILE SEARCH ON ANY EXECUTOR
+
+# The searches above always use Threads. Here every subdirectory of 'root'
+# is searched as one item of an Executor (see executors.py), which measures
+# the first few and runs the others on Threads or Processes, depending on how
+# much of the search is spent waiting for the disk and how much on the CPU.
+
+def search_tree(directory, file_name):
+    # Returns the paths of the entries under 'directory' whose name contains
+    # 'file_name'. A module-level function, so that it can run in a Process.
+    found = []
+    directories = [directory]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if file_name in entry.name:
+                        found.append(entry.path)
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+        except OSError:
+            pass
+    return found
+
+
+def file_search_executor(root, file_name, executor=None):
+    # Returns the paths of the entries under 'root' whose name contains
+    # 'file_name'
+    found = []
+    subdirectories = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if file_name in entry.name:
+                found.append(entry.path)
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+    own_executor = executor is None
+    if own_executor:
+        executor = Executor()
+    try:
+        for matches_in_tree in executor.map(
+                functools.partial(search_tree, file_name=file_name),
+                subdirectories):
+            found.extend(matches_in_tree)
+    finally:
+        if own_executor:
+            executor.close()
+    return found
 
 
 def main():
@@ -87,4 +260,5 @@ def main():
         print('Matched: ', m)
 
 
-main()
+if __name__ == '__main__':
+    main()
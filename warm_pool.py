@@ -0,0 +1,240 @@
+# A POOL OF WARM WORKER PROCESSES WITH ZERO-COPY ARGUMENTS
+
+# creating_processes.py pays the full cost of starting a Process, with the
+# 'spawn' method, for every piece of work: a new interpreter is started, the
+# modules are imported again and the arguments are pickled and sent through
+# a pipe. The comments there explain that 'forkserver' starts Processes
+# faster, but even then nothing is reused. Here the worker Processes are
+# started once, with the start method of your choice and with the modules
+# they need already imported, and they then run task after task.
+
+# Large arguments and results are not pickled through the pipe to the
+# workers. Pickle protocol 5 can hand the large buffers of an object (a
+# PickleBuffer, a bytearray, a NumPy array...) to a callback instead of
+# copying them into the pickle. Those buffers are copied once into a block of
+# shared memory (multiprocessing.shared_memory), only its name goes through
+# the pipe, and the worker unpickles the arguments with views of the shared
+# memory as their buffers, without copying them again.
+
+# To avoid even that one copy, allocate the data in shared memory from the
+# start with a SharedBuffer. A SharedBuffer is pickled as the name of its
+# block of shared memory, so passing it to a worker, or returning one from a
+# worker, copies nothing at all. The task reads and writes the data through
+# its 'buf' memoryview.
+#
+#   with WarmPool(start_method='forkserver', preload=['json']) as pool:
+#       data = SharedBuffer(1 << 30)
+#       data.buf[:] = ...
+#       print(pool.run(checksum, data))
+
+import importlib
+import multiprocessing
+import os
+import pickle
+from multiprocessing import resource_tracker, shared_memory
+
+# buffers smaller than this are still pickled in-band, where a block of
+# shared memory would cost more than it saves
+OUT_OF_BAND_THRESHOLD = 64 * 1024
+
+
+class SharedBuffer:
+    # A block of shared memory of 'size' bytes. The Process that creates it
+    # owns it and removes it on close(). A SharedBuffer returned by a worker
+    # task is owned by the caller that receives it.
+
+    def __init__(self, size, name=None):
+        self.size = size
+        self.owner = name is None
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True,
+                                                  size=max(size, 1))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        # the block may be larger than asked for, rounded up to whole pages
+        self.buf = self.shm.buf[:size]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __reduce__(self):
+        return (SharedBuffer, (self.size, self.shm.name))
+
+    def close(self):
+        if self.buf is None:
+            return
+        self.buf.release()
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __del__(self):
+        # the view has to be released before the block can be unmapped
+        if getattr(self, 'buf', None) is not None:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def _dumps(obj):
+    # Pickles 'obj' with its large buffers in a block of shared memory.
+    # Returns the pickle, the name of the block (None when there is no large
+    # buffer) and the sizes of the buffers stored in it.
+    buffers = []
+
+    def out_of_band(buffer):
+        if buffer.raw().nbytes < OUT_OF_BAND_THRESHOLD:
+            return True
+        buffers.append(buffer)
+        return False
+
+    data = pickle.dumps(obj, protocol=5, buffer_callback=out_of_band)
+    if not buffers:
+        return data, None, []
+    sizes = [b.raw().nbytes for b in buffers]
+    shm = shared_memory.SharedMemory(create=True, size=sum(sizes))
+    offset = 0
+    for buffer, size in zip(buffers, sizes):
+        shm.buf[offset:offset + size] = buffer.raw()
+        offset += size
+    name = shm.name
+    # the receiver removes the block once it has attached to it
+    shm.close()
+    return data, name, sizes
+
+
+def _attach(name, sizes):
+    shm = shared_memory.SharedMemory(name=name)
+    # the name is no longer needed once we are attached, and removing it now
+    # means the block cannot leak even if the task fails
+    shm.unlink()
+    views = []
+    offset = 0
+    for size in sizes:
+        views.append(shm.buf[offset:offset + size])
+        offset += size
+    return shm, views
+
+
+def _detach(shm, views):
+    for view in views:
+        view.release()
+    try:
+        shm.close()
+    except BufferError:
+        # the task kept a reference to its arguments, the block is freed
+        # when that reference goes away
+        pass
+
+
+def _preload(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _worker_pid(_):
+    return os.getpid()
+
+
+def _run(message):
+    data, name, sizes = message
+    if name is None:
+        func, args = pickle.loads(data)
+        result = func(*args)
+    else:
+        shm, views = _attach(name, sizes)
+        try:
+            func, args = pickle.loads(data, buffers=views)
+            result = func(*args)
+            del func, args
+        finally:
+            _detach(shm, views)
+    reply = _dumps(result)
+    if isinstance(result, SharedBuffer):
+        # the caller owns it now, we only let go of our mapping
+        result.owner = False
+        result.close()
+    return reply
+
+
+def _receive(reply):
+    data, name, sizes = reply
+    if name is None:
+        result = pickle.loads(data)
+    else:
+        # results are copied out of the shared memory once, so that they do
+        # not depend on it; return a SharedBuffer to avoid that copy
+        shm, views = _attach(name, sizes)
+        try:
+            result = pickle.loads(data,
+                                  buffers=[bytearray(v) for v in views])
+        finally:
+            _detach(shm, views)
+    if isinstance(result, SharedBuffer):
+        result.owner = True
+    return result
+
+
+class Task:
+    # the pending result of WarmPool.submit()
+
+    def __init__(self, async_result):
+        self.async_result = async_result
+
+    def ready(self):
+        return self.async_result.ready()
+
+    def result(self, timeout=None):
+        return _receive(self.async_result.get(timeout))
+
+
+class WarmPool:
+
+    def __init__(self, workers=None, start_method=None, preload=()):
+        preload = tuple(preload)
+        context = multiprocessing.get_context(start_method)
+        if context.get_start_method() == 'forkserver' and preload:
+            # the forkserver imports them once, every worker forked from it
+            # starts with them already imported
+            context.set_forkserver_preload(list(preload))
+        # start the resource tracker before the workers, so that they all
+        # share it with us and blocks of shared memory created by one Process
+        # can be removed by another
+        resource_tracker.ensure_running()
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = context.Pool(self.workers, initializer=_preload,
+                                 initargs=(preload,))
+        # one small task per worker, so that the workers are up and have
+        # imported the preloaded modules before the first real task. A worker
+        # that is ready early may take several of them, so this warms the
+        # pool up rather than guaranteeing every worker is ready.
+        self.pool.map(_worker_pid, range(self.workers), chunksize=1)
+
+    def submit(self, func, *args):
+        # 'func' must be a module-level function
+        return Task(self.pool.apply_async(_run, (_dumps((func, args)),)))
+
+    def run(self, func, *args):
+        return self.submit(func, *args).result()
+
+    def map(self, func, iterable):
+        tasks = [self.submit(func, item) for item in iterable]
+        return [task.result() for task in tasks]
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False